@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import logging
+import time
+from bisect import bisect
+from contextlib import suppress
+from typing import TYPE_CHECKING, Iterable, List, Optional, Tuple
+
+from common.database import Redis
+
+from .const import REDIRECT_CLOSE_CODE
+
+if TYPE_CHECKING:
+    from .pubsub import ChatHub
+
+logger = logging.getLogger(__name__)
+
+
+class HashRing:
+    def __init__(self, nodes: Iterable[str], replicas: int = 160) -> None:
+        self.nodes = frozenset(nodes)
+        points: List[Tuple[int, str]] = sorted(
+            (self.hash(f"{node}#{replica}"), node)
+            for node in self.nodes
+            for replica in range(replicas)
+        )
+        self._hashes = [point for point, _ in points]
+        self._nodes = [node for _, node in points]
+
+    @staticmethod
+    def hash(key: str) -> int:
+        return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], "big")
+
+    def get(self, key: str) -> Optional[str]:
+        if not self._nodes:
+            return None
+        index = bisect(self._hashes, self.hash(key)) % len(self._nodes)
+        return self._nodes[index]
+
+
+class RoomAffinity:
+    PODS_KEY = "affinity:pods"
+
+    def __init__(
+        self,
+        hub: ChatHub,
+        redis: Redis,
+        address: str,
+        enabled: bool = False,
+        ttl: float = 15.0,
+        refresh_interval: float = 5.0,
+        replicas: int = 160,
+        settle: float = 15.0,
+    ) -> None:
+        self._hub = hub
+        self._redis = redis
+        self.address = address
+        self.enabled = enabled
+        self._ttl = ttl
+        self._refresh_interval = refresh_interval
+        self._replicas = replicas
+        self._settle = settle
+        self.ring = HashRing([address], replicas)
+        self._changed_at = time.monotonic()
+        self._refresher: Optional[asyncio.Task] = None
+
+    def owner(self, room_id: int) -> Optional[str]:
+        return self.ring.get(str(room_id))
+
+    def owns(self, room_id: int) -> bool:
+        return not self.enabled or self.owner(room_id) == self.address
+
+    @property
+    def settled(self) -> bool:
+        return time.monotonic() - self._changed_at >= self._settle
+
+    def delivers_locally(self, room_id: int) -> bool:
+        return self.enabled and self.settled and self.owns(room_id)
+
+    async def start(self) -> None:
+        if not self.enabled or self._refresher is not None:
+            return
+        await self.refresh()
+        self._refresher = asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self._refresh_interval)
+            try:
+                await self.refresh()
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                logger.warning(f"Can't refresh the room affinity ring: {exc!r}")
+
+    async def refresh(self) -> None:
+        now = time.time()
+        async with self._redis.connection.pipeline(transaction=False) as pipe:
+            pipe.zadd(self.PODS_KEY, {self.address: now + self._ttl})
+            pipe.zremrangebyscore(self.PODS_KEY, "-inf", now)
+            pipe.zrangebyscore(self.PODS_KEY, now, "+inf")
+            *_, pods = await pipe.execute()
+        nodes = {pod.decode() for pod in pods}
+        if nodes != self.ring.nodes:
+            logger.info(f"Room affinity ring changed: {sorted(nodes)!r}")
+            self.ring = HashRing(nodes, self._replicas)
+            self._changed_at = time.monotonic()
+            self.redirect_lost_rooms()
+
+    def redirect_lost_rooms(self) -> None:
+        for channel, sockets in list(self._hub.channels.items()):
+            room_id = int(channel.rpartition(":")[2])
+            if self.owns(room_id):
+                continue
+            owner = self.owner(room_id)
+            for socket in list(sockets):
+                socket.abort(REDIRECT_CLOSE_CODE, owner)
+
+    async def close(self) -> None:
+        if self._refresher is None:
+            return
+        self._refresher.cancel()
+        with suppress(asyncio.CancelledError):
+            await self._refresher
+        self._refresher = None
+        await self._redis.connection.zrem(self.PODS_KEY, self.address)
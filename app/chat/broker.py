@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+
+import asyncio
+import base64
+from abc import ABC, abstractmethod
+from typing import Any, AsyncIterator, Iterable, List, Optional, Set, Tuple, Union
+
+from aioredis.client import PubSub
+from common.database import Database, Redis
+from sqlalchemy import text
+
+
+class Broker(ABC):
+    shares_redis = False
+
+    @abstractmethod
+    async def publish(self, channel: str, payload: bytes) -> None:
+        ...
+
+    async def publish_many(self, messages: Iterable[Tuple[str, bytes]]) -> None:
+        for channel, payload in messages:
+            await self.publish(channel, payload)
+
+    @abstractmethod
+    async def subscribe(self, *channels: str) -> None:
+        ...
+
+    @abstractmethod
+    async def unsubscribe(self, *channels: str) -> None:
+        ...
+
+    @abstractmethod
+    def listen(self) -> AsyncIterator[Tuple[str, bytes]]:
+        ...
+
+    async def resubscribe(self, channels: Iterable[str]) -> None:
+        channels = list(channels)
+        if channels:
+            await self.subscribe(*channels)
+
+    async def close(self) -> None:
+        pass
+
+
+class RedisBroker(Broker):
+    shares_redis = True
+
+    def __init__(self, redis: Redis) -> None:
+        self._redis = redis
+        self._pubsub: Optional[PubSub] = None
+
+    @property
+    def pubsub(self) -> PubSub:
+        if self._pubsub is None:
+            self._pubsub = self._redis.connection.pubsub(ignore_subscribe_messages=True)
+        return self._pubsub
+
+    async def publish(self, channel: str, payload: bytes) -> None:
+        await self._redis.connection.publish(channel, payload)
+
+    async def publish_many(self, messages: Iterable[Tuple[str, bytes]]) -> None:
+        messages = list(messages)
+        if not messages:
+            return
+        async with self._redis.connection.pipeline(transaction=False) as pipe:
+            for channel, payload in messages:
+                pipe.publish(channel, payload)
+            await pipe.execute()
+
+    async def subscribe(self, *channels: str) -> None:
+        await self.pubsub.subscribe(*channels)
+
+    async def unsubscribe(self, *channels: str) -> None:
+        await self.pubsub.unsubscribe(*channels)
+
+    async def listen(self) -> AsyncIterator[Tuple[str, bytes]]:
+        async for message in self.pubsub.listen():
+            yield message["channel"].decode(), message["data"]
+
+    async def resubscribe(self, channels: Iterable[str]) -> None:
+        pubsub, self._pubsub = self._pubsub, None
+        if pubsub is not None:
+            await pubsub.reset()
+        await super().resubscribe(channels)
+
+    async def close(self) -> None:
+        if self._pubsub is not None:
+            await self._pubsub.close()
+
+
+class InProcessBroker(Broker):
+    def __init__(self) -> None:
+        self._channels: Set[str] = set()
+        self._queue: asyncio.Queue = asyncio.Queue()
+
+    async def publish(self, channel: str, payload: bytes) -> None:
+        if channel in self._channels:
+            self._queue.put_nowait((channel, payload))
+
+    async def subscribe(self, *channels: str) -> None:
+        self._channels.update(channels)
+
+    async def unsubscribe(self, *channels: str) -> None:
+        self._channels.difference_update(channels)
+
+    async def listen(self) -> AsyncIterator[Tuple[str, bytes]]:
+        while True:
+            yield await self._queue.get()
+
+
+class PostgresBroker(Broker):
+    NOTIFY = text("SELECT pg_notify(:channel, :payload)")
+    NOTIFY_MANY = text(
+        "SELECT pg_notify(channel, payload) "
+        "FROM unnest(CAST(:channels AS text[]), CAST(:payloads AS text[])) "
+        "AS notification(channel, payload)"
+    )
+
+    def __init__(self, database: Database) -> None:
+        self._database = database
+        self._listener: Any = None
+        self._fileno = -1
+        self._lock = asyncio.Lock()
+        self._queue: asyncio.Queue = asyncio.Queue()
+
+    @staticmethod
+    def _encode(payload: bytes) -> str:
+        return base64.b64encode(payload).decode()
+
+    @staticmethod
+    def _quote(channel: str) -> str:
+        return '"' + channel.replace('"', '""') + '"'
+
+    async def publish(self, channel: str, payload: bytes) -> None:
+        await self._notify(
+            self.NOTIFY, {"channel": channel, "payload": self._encode(payload)}
+        )
+
+    async def publish_many(self, messages: Iterable[Tuple[str, bytes]]) -> None:
+        messages = list(messages)
+        if not messages:
+            return
+        await self._notify(
+            self.NOTIFY_MANY,
+            {
+                "channels": [channel for channel, _ in messages],
+                "payloads": [self._encode(payload) for _, payload in messages],
+            },
+        )
+
+    async def _notify(self, statement: Any, params: dict) -> None:
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self._execute, statement, params)
+
+    def _execute(self, statement: Any, params: dict) -> None:
+        with self._database.session() as session:
+            session.execute(statement, params)
+            session.commit()
+
+    def _connect(self) -> Any:
+        listener = self._database.raw_connection()
+        listener.driver_connection.autocommit = True
+        return listener
+
+    def _execute_on(self, listener: Any, command: str, channels: List[str]) -> None:
+        with listener.driver_connection.cursor() as cursor:
+            for channel in channels:
+                cursor.execute(f"{command} {self._quote(channel)}")
+
+    async def _command(self, command: str, channels: Iterable[str]) -> None:
+        loop = asyncio.get_running_loop()
+        async with self._lock:
+            if self._listener is None:
+                listener = await loop.run_in_executor(None, self._connect)
+                self._listener = listener
+                self._fileno = listener.driver_connection.fileno()
+                loop.add_reader(self._fileno, self._poll)
+            listener = self._listener
+            await loop.run_in_executor(
+                None, self._execute_on, listener, command, list(channels)
+            )
+            self._drain(listener)
+
+    def _poll(self) -> None:
+        listener = self._listener
+        try:
+            listener.driver_connection.poll()
+        except Exception as exc:
+            self._drop_listener()
+            self._queue.put_nowait(exc)
+            return
+        self._drain(listener)
+
+    def _drain(self, listener: Any) -> None:
+        notifies = listener.driver_connection.notifies
+        while notifies:
+            notification = notifies.pop(0)
+            self._queue.put_nowait(
+                (notification.channel, base64.b64decode(notification.payload))
+            )
+
+    def _drop_listener(self) -> None:
+        listener, self._listener = self._listener, None
+        if listener is None:
+            return
+        asyncio.get_running_loop().remove_reader(self._fileno)
+        listener.invalidate()
+
+    async def subscribe(self, *channels: str) -> None:
+        await self._command("LISTEN", channels)
+
+    async def unsubscribe(self, *channels: str) -> None:
+        await self._command("UNLISTEN", channels)
+
+    async def listen(self) -> AsyncIterator[Tuple[str, bytes]]:
+        while True:
+            item: Union[Exception, Tuple[str, bytes]] = await self._queue.get()
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+    async def resubscribe(self, channels: Iterable[str]) -> None:
+        self._drop_listener()
+        await super().resubscribe(channels)
+
+    async def close(self) -> None:
+        self._drop_listener()
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+
+import hashlib
+import re
+import sys
+import zlib
+from collections import Counter
+from typing import Iterable, List
+
+import orjson
+
+TOKEN = re.compile(
+    rb'"(?:[^"\\]|\\.)*"\s*:?|-?\d+(?:\.\d+)?(?:[eE][+-]?\d+)?|true|false|null|[{}\[\],]'
+)
+
+
+class PayloadCodec:
+    MARKER = b"\x01"
+    fingerprint = ""
+
+    def encode(self, data: bytes) -> bytes:
+        return data
+
+    def decode(self, payload: bytes) -> bytes:
+        if payload.startswith(self.MARKER):
+            raise ValueError(
+                "Payload is dictionary-compressed, REDIS_PAYLOAD_DICTIONARY is unset"
+            )
+        return payload
+
+
+class DictionaryCodec(PayloadCodec):
+    MEMORY_LEVEL = 4
+
+    def __init__(self, dictionary: bytes, level: int = 6) -> None:
+        self.dictionary = dictionary
+        self.fingerprint = hashlib.sha256(dictionary).hexdigest()[:16]
+        self.window_bits = max(9, min(15, (len(dictionary) + 1024).bit_length()))
+        self._compressor = zlib.compressobj(
+            level,
+            zlib.DEFLATED,
+            -self.window_bits,
+            self.MEMORY_LEVEL,
+            zdict=dictionary,
+        )
+        self._decompressor = zlib.decompressobj(-self.window_bits, zdict=dictionary)
+
+    def encode(self, data: bytes) -> bytes:
+        compressor = self._compressor.copy()
+        return self.MARKER + compressor.compress(data) + compressor.flush()
+
+    def decode(self, payload: bytes) -> bytes:
+        if not payload.startswith(self.MARKER):
+            return payload
+        decompressor = self._decompressor.copy()
+        return decompressor.decompress(payload[len(self.MARKER) :]) + decompressor.flush()
+
+
+def train_dictionary(samples: Iterable[bytes], size: int = 4096) -> bytes:
+    scores: Counter = Counter()
+    for sample in samples:
+        tokens = TOKEN.findall(sample)
+        for length in (1, 2, 4, 8):
+            for start in range(0, len(tokens) - length + 1):
+                fragment = b"".join(tokens[start : start + length])
+                scores[fragment] += len(fragment)
+
+    chosen: List[bytes] = []
+    total = 0
+    for fragment, _ in scores.most_common():
+        if len(fragment) < 3 or any(fragment in kept for kept in chosen):
+            continue
+        if total + len(fragment) > size:
+            break
+        chosen.append(fragment)
+        total += len(fragment)
+    return b"".join(reversed(chosen))
+
+
+def load_codec(dictionary_path: str = None) -> PayloadCodec:
+    if not dictionary_path:
+        return PayloadCodec()
+    with open(dictionary_path, "rb") as dictionary:
+        return DictionaryCodec(dictionary.read())
+
+
+if __name__ == "__main__":
+    workload, output = sys.argv[1], sys.argv[2]
+    with open(workload, "rb") as recorded:
+        samples = [orjson.dumps(orjson.loads(line)) for line in recorded if line.strip()]
+    with open(output, "wb") as dictionary:
+        dictionary.write(train_dictionary(samples))
@@ -9,6 +9,35 @@ class MessageType(str, Enum):
     SYSTEM = "system"
 
 
+class EphemeralType(str, Enum):
+    PRESENCE = "presence"
+    TYPING = "typing"
+    PING = "ping"
+    PONG = "pong"
+
+
+SYSTEM_MESSAGE_TYPES = frozenset({MessageType.SYSTEM, MessageType.NOTIFICATION})
+
+
+REDIRECT_CLOSE_CODE = 4301
+
+
 class MessageReceiverType(str, Enum):
     USER = "user"
     SYSTEM = "system"
+
+
+class OverflowPolicy(str, Enum):
+    DROP_OLDEST = "drop_oldest"
+    DROP_NON_SYSTEM = "drop_non_system"
+    DISCONNECT = "disconnect"
+
+
+class WireProtocol(str, Enum):
+    JSON = "chat.json.v1"
+    MSGPACK = "chat.msgpack.v1"
+
+
+class RateLimitAction(str, Enum):
+    DROP = "drop"
+    ERROR = "error"
@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+
+import asyncio
+import logging
+from contextlib import suppress
+from typing import TYPE_CHECKING, Dict, List, Optional
+
+import orjson
+from common.database import Redis
+
+from .const import MessageType
+from .frame import Frame, log_id_key
+from .unread import UnreadCounter
+
+if TYPE_CHECKING:
+    from .pubsub import ChatHub
+
+logger = logging.getLogger(__name__)
+
+
+ADVANCE_CURSORS = """
+local function position(log_id)
+    local milliseconds, sequence = string.match(log_id, '^(%d+)-(%d+)$')
+    return tonumber(milliseconds), tonumber(sequence)
+end
+
+local advanced = {}
+for i = 1, #ARGV, 2 do
+    local current = redis.call('HGET', KEYS[1], ARGV[i])
+    local newer = not current
+    if current then
+        local ms, seq = position(ARGV[i + 1])
+        local current_ms, current_seq = position(current)
+        newer = ms > current_ms or (ms == current_ms and seq > current_seq)
+    end
+    if newer then
+        redis.call('HSET', KEYS[1], ARGV[i], ARGV[i + 1])
+        local entry = redis.call('XRANGE', KEYS[3], ARGV[i + 1], ARGV[i + 1])[1]
+        local fields = entry and entry[2] or {}
+        for j = 1, #fields, 2 do
+            if fields[j] == 's' then
+                local read = tonumber(redis.call('HGET', KEYS[2], ARGV[i]) or '0')
+                if tonumber(fields[j + 1]) > read then
+                    redis.call('HSET', KEYS[2], ARGV[i], fields[j + 1])
+                end
+            end
+        end
+        advanced[#advanced + 1] = ARGV[i]
+        advanced[#advanced + 1] = ARGV[i + 1]
+    end
+end
+return advanced
+"""
+
+
+class ReadCursorStore:
+    def __init__(self, hub: ChatHub, redis: Redis, flush_interval: float = 0.5) -> None:
+        self._hub = hub
+        self._redis = redis
+        self._advance = redis.connection.register_script(ADVANCE_CURSORS)
+        self._flush_interval = flush_interval
+        self._pending: Dict[str, Dict[int, str]] = {}
+        self._flusher: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def key(channel: str) -> str:
+        return f"{channel}:cursors"
+
+    def ack(self, channel: str, user_id: int, log_id: str) -> None:
+        self._remember(channel, user_id, log_id)
+        if self._flusher is None:
+            self._flusher = asyncio.create_task(self._flush_later())
+
+    def _remember(self, channel: str, user_id: int, log_id: str) -> None:
+        pending = self._pending.setdefault(channel, {})
+        current = pending.get(user_id)
+        if current is None or log_id_key(log_id) > log_id_key(current):
+            pending[user_id] = log_id
+
+    async def _flush_later(self) -> None:
+        try:
+            await asyncio.sleep(self._flush_interval)
+        finally:
+            self._flusher = None
+        await self.flush()
+
+    async def flush(self) -> None:
+        pending, self._pending = self._pending, {}
+        if not pending:
+            return
+        channels = list(pending)
+        try:
+            async with self._redis.connection.pipeline(transaction=False) as pipe:
+                for channel in channels:
+                    await self._advance(
+                        keys=[
+                            self.key(channel),
+                            UnreadCounter.key(channel),
+                            self._hub.log_key(channel),
+                        ],
+                        args=[
+                            value
+                            for user_id, log_id in pending[channel].items()
+                            for value in (user_id, log_id)
+                        ],
+                        client=pipe,
+                    )
+                results = await pipe.execute()
+        except Exception as exc:
+            logger.warning(f"Can't write read cursors of {channels!r}: {exc!r}")
+            for channel, cursors in pending.items():
+                for user_id, log_id in cursors.items():
+                    self._remember(channel, user_id, log_id)
+            if self._flusher is None:
+                self._flusher = asyncio.create_task(self._flush_later())
+            return
+        await self._hub.notify_many(
+            (channel, self.frame(advanced))
+            for channel, advanced in zip(channels, results)
+            if advanced
+        )
+
+    @staticmethod
+    def frame(advanced: List[bytes]) -> Frame:
+        cursors = {
+            advanced[i].decode(): advanced[i + 1].decode()
+            for i in range(0, len(advanced), 2)
+        }
+        return Frame(orjson.dumps({"type": MessageType.READ, "cursors": cursors}))
+
+    async def get_all(self, channel: str) -> Dict[int, str]:
+        cursors = await self._redis.connection.hgetall(self.key(channel))
+        return {int(user_id): log_id.decode() for user_id, log_id in cursors.items()}
+
+    async def get_readers(self, channel: str, log_id: str) -> List[int]:
+        position = log_id_key(log_id)
+        cursors = await self.get_all(channel)
+        return sorted(
+            user_id
+            for user_id, cursor in cursors.items()
+            if log_id_key(cursor) >= position
+        )
+
+    async def close(self) -> None:
+        if self._flusher is not None:
+            self._flusher.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._flusher
+        await self.flush()
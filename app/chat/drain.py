@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+
+import asyncio
+import logging
+import random
+import secrets
+from contextlib import suppress
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List, Optional, Tuple
+
+import orjson
+from common.database import Redis
+from fastapi import WebSocket, status
+from user.response import User
+
+if TYPE_CHECKING:
+    from .pubsub import ChatHub
+    from .socket_handler import SocketHandler
+
+logger = logging.getLogger(__name__)
+
+
+class ResumeState:
+    __slots__ = ("user", "room_id", "last_log_id", "session_id")
+
+    def __init__(
+        self,
+        user: User,
+        room_id: int,
+        last_log_id: Optional[str],
+        session_id: Optional[str] = None,
+    ) -> None:
+        self.user = user
+        self.room_id = room_id
+        self.last_log_id = last_log_id
+        self.session_id = session_id
+
+
+class ConnectionDrainer:
+    CLOSE_CODE = status.WS_1012_SERVICE_RESTART
+
+    def __init__(
+        self,
+        hub: ChatHub,
+        redis: Redis,
+        timeout: float = 10.0,
+        reconnect_window: float = 30.0,
+        resume_ttl: float = 120.0,
+        admin_token: str = "",
+    ) -> None:
+        self._hub = hub
+        self._redis = redis
+        self._timeout = timeout
+        self._reconnect_window = reconnect_window
+        self._resume_ttl = resume_ttl
+        self._admin_token = admin_token
+        self._drain: Optional[asyncio.Task] = None
+        self.draining = False
+        self.drained = 0
+        self.resumed = 0
+
+    @staticmethod
+    def key(token: str) -> str:
+        return f"resume:{token}"
+
+    def authorized(self, token: str) -> bool:
+        return bool(self._admin_token) and secrets.compare_digest(
+            token, self._admin_token
+        )
+
+    def retry_after(self) -> float:
+        return round(random.uniform(0, self._reconnect_window), 3)
+
+    def close_reason(self, token: Optional[str] = None) -> str:
+        reason: Dict[str, Any] = {"retry_after": self.retry_after()}
+        if token is not None:
+            reason["resume_token"] = token
+        return orjson.dumps(reason).decode()
+
+    async def refuse(self, socket: WebSocket) -> None:
+        await socket.accept()
+        await socket.close(code=self.CLOSE_CODE, reason=self.close_reason())
+
+    def drain(self) -> asyncio.Task:
+        self.draining = True
+        if self._drain is None:
+            self._drain = asyncio.create_task(self._run())
+        return self._drain
+
+    async def _run(self) -> int:
+        drained = 0
+        while True:
+            sockets = [
+                (channel, socket)
+                for channel, members in list(self._hub.channels.items())
+                for socket in members
+                if socket.socket is not None
+            ]
+            if not sockets:
+                break
+            logger.info(f"Draining {len(sockets)} websockets")
+            latest = await self._latest({channel for channel, _ in sockets})
+            await asyncio.gather(
+                *(self._flush(socket) for _, socket in sockets), return_exceptions=True
+            )
+            tokens = await self._issue(sockets, latest)
+            for (_, socket), token in zip(sockets, tokens):
+                with suppress(Exception):
+                    await socket.disconnect(self.CLOSE_CODE, self.close_reason(token))
+            drained += len(sockets)
+        self.drained += drained
+        return drained
+
+    async def _flush(self, socket: SocketHandler) -> None:
+        with suppress(asyncio.TimeoutError):
+            await asyncio.wait_for(socket.flush(), self._timeout)
+
+    async def _latest(
+        self, channels: Iterable[str]
+    ) -> Optional[Dict[str, Optional[str]]]:
+        channels = list(channels)
+        try:
+            async with self._redis.connection.pipeline(transaction=False) as pipe:
+                for channel in channels:
+                    pipe.xrevrange(self._hub.log_key(channel), count=1)
+                return {
+                    channel: entries[0][0].decode() if entries else None
+                    for channel, entries in zip(channels, await pipe.execute())
+                }
+        except Exception as exc:
+            logger.warning(f"Can't read the latest log ids: {exc!r}")
+            return None
+
+    async def _issue(
+        self,
+        sockets: List[Tuple[str, SocketHandler]],
+        latest: Optional[Dict[str, Optional[str]]],
+    ) -> List[Optional[str]]:
+        if latest is None:
+            return [None] * len(sockets)
+        try:
+            async with self._redis.connection.pipeline(transaction=False) as pipe:
+                tokens = [secrets.token_urlsafe(16) for _ in sockets]
+                for (channel, socket), token in zip(sockets, tokens):
+                    state = {
+                        "user": socket.user.dict(),
+                        "room_id": int(channel.rpartition(":")[2]),
+                        "last_log_id": socket.resume_point() or latest[channel],
+                        "session_id": socket.session_id,
+                    }
+                    pipe.set(
+                        self.key(token), orjson.dumps(state), ex=int(self._resume_ttl)
+                    )
+                await pipe.execute()
+        except Exception as exc:
+            logger.warning(f"Can't issue resume tokens: {exc!r}")
+            return [None] * len(sockets)
+        return tokens
+
+    async def resume(self, token: str) -> Optional[ResumeState]:
+        try:
+            async with self._redis.connection.pipeline(transaction=True) as pipe:
+                pipe.get(self.key(token))
+                pipe.delete(self.key(token))
+                state, _ = await pipe.execute()
+        except Exception as exc:
+            logger.warning(f"Can't read resume token: {exc!r}")
+            return None
+        if state is None:
+            return None
+        state = orjson.loads(state)
+        self.resumed += 1
+        return ResumeState(
+            User(**state["user"]),
+            state["room_id"],
+            state["last_log_id"],
+            state.get("session_id"),
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "draining": self.draining,
+            "drained": self.drained,
+            "resumed": self.resumed,
+        }
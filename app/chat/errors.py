@@ -35,3 +35,8 @@ class AlreadyJoinedError(DatabaseIntegrityError):
 class ChatRoomAlreadyExistError(DatabaseIntegrityError):
     def __init__(self, name: str, description: str) -> None:
         super().__init__(f"ChatRoom({name=!r}, {description=!r}) is already exist")
+
+
+class InvalidFrameError(ValueError):
+    def __init__(self, reason: str) -> None:
+        super().__init__(f"Invalid frame: {reason}")
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+
+from typing import Optional, Tuple, Union
+
+import msgpack
+import orjson
+
+from .const import SYSTEM_MESSAGE_TYPES
+from .message import BaseMessage
+
+
+class Frame:
+    __slots__ = ("_data", "_text", "_packed", "system", "log_id")
+
+    def __init__(
+        self, data: Union[bytes, str], system: bool = False, log_id: Optional[str] = None
+    ) -> None:
+        self._data: Optional[bytes] = None
+        self._text: Optional[str] = None
+        self._packed: Optional[bytes] = None
+        if isinstance(data, str):
+            self._text = data
+        else:
+            self._data = data
+        self.system = system
+        self.log_id = log_id
+
+    @classmethod
+    def from_message(cls, message: BaseMessage) -> Frame:
+        return cls(orjson.dumps(message.dict()), system=message.is_system)
+
+    @classmethod
+    def from_payload(
+        cls, payload: Union[bytes, str], log_id: Optional[str] = None
+    ) -> Frame:
+        message = orjson.loads(payload)
+        system = message.get("type") in SYSTEM_MESSAGE_TYPES
+        if log_id is None:
+            return cls(payload, system=system)
+        message["log_id"] = log_id
+        return cls(orjson.dumps(message), system=system, log_id=log_id)
+
+    @property
+    def data(self) -> bytes:
+        if self._data is None:
+            self._data = self._text.encode("utf-8")
+        return self._data
+
+    @property
+    def text(self) -> str:
+        if self._text is None:
+            self._text = self._data.decode("utf-8")
+        return self._text
+
+    @property
+    def packed(self) -> bytes:
+        if self._packed is None:
+            self._packed = msgpack.packb(orjson.loads(self.data))
+        return self._packed
+
+    def __repr__(self) -> str:
+        return (
+            f"Frame(data={self.data!r}, system={self.system!r}, log_id={self.log_id!r})"
+        )
+
+
+def log_id_key(log_id: str) -> Tuple[int, int]:
+    milliseconds, _, sequence = log_id.partition("-")
+    return int(milliseconds), int(sequence or 0)
+
+
+def log_id_before(log_id: str) -> str:
+    milliseconds, sequence = log_id_key(log_id)
+    if sequence:
+        return f"{milliseconds}-{sequence - 1}"
+    return f"{milliseconds - 1}-{2**64 - 1}"
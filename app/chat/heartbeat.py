@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+
+import asyncio
+import logging
+import math
+from contextlib import suppress
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Set
+
+from fastapi import status
+
+if TYPE_CHECKING:
+    from .socket_handler import SocketHandler
+
+logger = logging.getLogger(__name__)
+
+
+class TimerWheel:
+    def __init__(self, tick: float, slots: int) -> None:
+        self.tick = tick
+        self._slots: List[Set[Any]] = [set() for _ in range(slots)]
+        self._slot_of: Dict[Any, int] = {}
+        self._cursor = 0
+
+    def __len__(self) -> int:
+        return len(self._slot_of)
+
+    def schedule(self, item: Any, delay: float) -> None:
+        self.cancel(item)
+        ticks = min(len(self._slots) - 1, max(1, math.ceil(delay / self.tick)))
+        slot = (self._cursor + ticks) % len(self._slots)
+        self._slots[slot].add(item)
+        self._slot_of[item] = slot
+
+    def cancel(self, item: Any) -> None:
+        slot = self._slot_of.pop(item, None)
+        if slot is not None:
+            self._slots[slot].discard(item)
+
+    def advance(self) -> Set[Any]:
+        self._cursor = (self._cursor + 1) % len(self._slots)
+        expired, self._slots[self._cursor] = self._slots[self._cursor], set()
+        for item in expired:
+            del self._slot_of[item]
+        return expired
+
+
+class HeartbeatMonitor:
+    def __init__(
+        self,
+        interval: float = 20.0,
+        idle_timeout: float = 60.0,
+        tick: float = 1.0,
+        close_code: int = status.WS_1001_GOING_AWAY,
+    ) -> None:
+        self.interval = interval
+        self.idle_timeout = idle_timeout
+        self.close_code = close_code
+        self._wheel = TimerWheel(tick, math.ceil(max(interval, idle_timeout) / tick) + 2)
+        self._ticker: Optional[asyncio.Task] = None
+        self.pings = 0
+        self.reaped = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.interval > 0
+
+    def watch(self, socket: SocketHandler) -> None:
+        if not self.enabled:
+            return
+        self._wheel.schedule(socket, self.interval)
+        if self._ticker is None:
+            self._ticker = asyncio.create_task(self._run())
+
+    def unwatch(self, socket: SocketHandler) -> None:
+        self._wheel.cancel(socket)
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time()
+        while True:
+            deadline += self._wheel.tick
+            await asyncio.sleep(max(0.0, deadline - loop.time()))
+            try:
+                self.expire(loop.time())
+            except Exception as exc:
+                logger.warning(f"Heartbeat tick failed: {exc!r}")
+
+    def expire(self, now: float) -> None:
+        for socket in self._wheel.advance():
+            idle = now - socket.last_seen
+            if idle >= self.idle_timeout:
+                logger.info(f"{socket.user_name!r} was idle for {idle:.1f}s, reaping")
+                self.reaped += 1
+                socket.abort(self.close_code)
+            elif idle >= self.interval:
+                self.pings += 1
+                socket.ping()
+                self._wheel.schedule(socket, min(self.interval, self.idle_timeout - idle))
+            else:
+                self._wheel.schedule(socket, self.interval - idle)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "watched": len(self._wheel),
+            "pings": self.pings,
+            "reaped": self.reaped,
+        }
+
+    async def close(self) -> None:
+        if self._ticker is not None:
+            self._ticker.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._ticker
+            self._ticker = None
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+
+import asyncio
+import logging
+from contextlib import suppress
+from typing import TYPE_CHECKING, Dict, Optional, Set, Tuple
+
+import orjson
+
+from .const import EphemeralType
+from .frame import Frame
+
+if TYPE_CHECKING:
+    from .pubsub import ChatHub
+
+logger = logging.getLogger(__name__)
+
+
+class TypingIndicator:
+    def __init__(self, hub: ChatHub, window: float = 3.0, tick: float = 0.25) -> None:
+        self._hub = hub
+        self._window = window
+        self._tick = tick
+        self._last_seen: Dict[Tuple[str, int], float] = {}
+        self._pending: Dict[str, Set[int]] = {}
+        self._flusher: Optional[asyncio.Task] = None
+
+    def typing(self, channel: str, user_id: int) -> None:
+        now = asyncio.get_running_loop().time()
+        last_seen = self._last_seen.get((channel, user_id))
+        if last_seen is not None and now - last_seen < self._window:
+            return
+        self._last_seen[(channel, user_id)] = now
+        self._pending.setdefault(channel, set()).add(user_id)
+        if self._flusher is None:
+            self._flusher = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self) -> None:
+        try:
+            await asyncio.sleep(self._tick)
+        finally:
+            self._flusher = None
+        await self.flush()
+
+    async def flush(self) -> None:
+        pending, self._pending = self._pending, {}
+        now = asyncio.get_running_loop().time()
+        self._last_seen = {
+            typist: last_seen
+            for typist, last_seen in self._last_seen.items()
+            if now - last_seen < self._window
+        }
+        if not pending:
+            return
+        frames = [
+            (
+                channel,
+                Frame(
+                    orjson.dumps(
+                        {
+                            "type": EphemeralType.TYPING,
+                            "user_ids": sorted(user_ids),
+                            "ttl": self._window,
+                        }
+                    )
+                ),
+            )
+            for channel, user_ids in pending.items()
+        ]
+        try:
+            await self._hub.notify_many(frames)
+        except Exception as exc:
+            logger.warning(f"Can't publish typing users of {list(pending)!r}: {exc!r}")
+
+    async def close(self) -> None:
+        if self._flusher is not None:
+            self._flusher.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._flusher
+        self._pending.clear()
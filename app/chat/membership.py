@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Set, Tuple
+
+from .repository import AsyncChatRoomMemberRepository
+
+
+class MembershipCache:
+    def __init__(
+        self,
+        chat_room_member_repository: AsyncChatRoomMemberRepository,
+        ttl: float = 60.0,
+        max_rooms: int = 1000,
+    ) -> None:
+        self._repository = chat_room_member_repository
+        self._ttl = ttl
+        self._max_rooms = max_rooms
+        self._rooms: OrderedDict[int, Tuple[float, Set[int]]] = OrderedDict()
+        self._loading: Dict[int, asyncio.Future[Set[int]]] = {}
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0
+        self.coalesced = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self._ttl > 0 and self._max_rooms > 0
+
+    def _get(self, room_id: int) -> Optional[Set[int]]:
+        entry = self._rooms.get(room_id)
+        if entry is None:
+            return None
+        expires_at, members = entry
+        if expires_at <= time.monotonic():
+            del self._rooms[room_id]
+            return None
+        self._rooms.move_to_end(room_id)
+        return members
+
+    async def _load(self, room_id: int) -> Set[int]:
+        loading = self._loading.get(room_id)
+        if loading is None:
+            loading = asyncio.ensure_future(self._fetch(room_id))
+            self._loading[room_id] = loading
+            loading.add_done_callback(lambda _: self._loading.pop(room_id, None))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(loading)
+
+    async def _fetch(self, room_id: int) -> Set[int]:
+        generation = self.generation
+        members = await self._repository.get_user_ids(room_id=room_id)
+        self.loads += 1
+        if generation == self.generation:
+            self._rooms[room_id] = (time.monotonic() + self._ttl, members)
+            self._rooms.move_to_end(room_id)
+            while len(self._rooms) > self._max_rooms:
+                self._rooms.popitem(last=False)
+        return members
+
+    async def contains(self, room_id: int, user_id: int) -> bool:
+        if not self.enabled:
+            return await self._repository.exists(room_id=room_id, user_id=user_id)
+        members = self._get(room_id)
+        if members is None:
+            return user_id in await self._load(room_id)
+        if user_id in members:
+            self.hits += 1
+            return True
+        self.misses += 1
+        if await self._repository.exists(room_id=room_id, user_id=user_id):
+            self.joined(room_id, user_id)
+            return True
+        return False
+
+    def joined(self, room_id: int, user_id: int) -> None:
+        members = self._get(room_id)
+        if members is not None:
+            members.add(user_id)
+
+    def left(self, room_id: int, user_id: int) -> None:
+        self.generation += 1
+        members = self._get(room_id)
+        if members is not None:
+            members.discard(user_id)
+
+    def drop(self, room_id: int) -> None:
+        self.generation += 1
+        self._rooms.pop(room_id, None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "rooms": len(self._rooms),
+            "members": sum(len(members) for _, members in self._rooms.values()),
+            "hits": self.hits,
+            "misses": self.misses,
+            "loads": self.loads,
+            "coalesced": self.coalesced,
+        }
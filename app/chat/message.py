@@ -1,26 +1,29 @@
 # -*- coding: utf-8 -*-
 import time
-from typing import Iterable, Optional
+from typing import Optional
 from uuid import uuid4
 
 from pydantic import BaseModel, Field
 from user.response import User
 
-from .const import MessageReceiverType, MessageType
+from .const import SYSTEM_MESSAGE_TYPES, MessageReceiverType, MessageType
 
 
 class MessageAction(BaseModel):
     text: str
-    target_message_id: Optional[str] = None
+    target_message_id: Optional[str] = Field(default=None, max_length=36)
 
 
 class BaseMessage(MessageAction):
     type: MessageType
     sender: User
     receiver: MessageReceiverType
-    reader: Iterable[int] = []
-    timestamp: float = Field(default=time.time())
-    id: str = Field(default=str(uuid4()))
+    timestamp: float = Field(default_factory=time.time)
+    id: str = Field(default_factory=lambda: str(uuid4()), max_length=36)
+
+    @property
+    def is_system(self) -> bool:
+        return self.type in SYSTEM_MESSAGE_TYPES
 
 
 class UserMessage(BaseMessage):
@@ -31,3 +34,8 @@ class SystemMessage(BaseMessage):
     type: MessageType = MessageType.SYSTEM
     receiver: MessageReceiverType = MessageReceiverType.USER
     sender: User = User(id=0, email="system", name="system")
+
+
+class ReadAck(BaseModel):
+    type: MessageType = MessageType.READ
+    log_id: str = Field(regex=r"^\d+-\d+$")
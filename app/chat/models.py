@@ -1,7 +1,7 @@
 # -*- coding: utf-8 -*-
 
 from common.database import Base
-from sqlalchemy import Column, ForeignKey, Integer, String, Text
+from sqlalchemy import BigInteger, Column, Float, ForeignKey, Index, Integer, String, Text
 from sqlalchemy.orm import relationship
 
 
@@ -21,6 +21,9 @@ class ChatRoom(Base):
 
 class ChatRoomMember(Base):
     __tablename__ = "chat_room_members"
+    __table_args__ = (
+        Index("ux_chat_room_members_room_id_user_id", "room_id", "user_id", unique=True),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     room_id = Column(Integer, ForeignKey("chat_rooms.id"), index=True)
@@ -31,3 +34,23 @@ class ChatRoomMember(Base):
 
     def __repr__(self) -> str:
         return f"ChatRoomMember(id={self.id!r}, room_id={self.room_id!r}, user_id={self.user_id!r})"
+
+
+class ChatMessage(Base):
+    __tablename__ = "chat_messages"
+    __table_args__ = (Index("ix_chat_messages_room_id_id", "room_id", "id"),)
+
+    id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True)
+    message_id = Column(String(36), index=True, nullable=False)
+    room_id = Column(
+        Integer, ForeignKey("chat_rooms.id", ondelete="CASCADE"), nullable=False
+    )
+    sender_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    type = Column(String(20), nullable=False)
+    text = Column(Text, nullable=False)
+    target_message_id = Column(String(36), nullable=True)
+    log_id = Column(String(32), nullable=True)
+    created_at = Column(Float, nullable=False)
+
+    def __repr__(self) -> str:
+        return f"ChatMessage(id={self.id!r}, room_id={self.room_id!r}, sender_id={self.sender_id!r})"
@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from contextlib import suppress
+from typing import Any, Dict, List, Optional
+
+from common.metrics import Histogram
+from sqlalchemy.exc import DBAPIError, InterfaceError, OperationalError, StatementError
+
+from .message import BaseMessage
+from .repository import ChatMessageRepository
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE_BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+
+class MessagePersister:
+    def __init__(
+        self,
+        chat_message_repository: ChatMessageRepository,
+        batch_size: int = 500,
+        flush_interval: float = 0.05,
+        queue_size: int = 10000,
+        max_retries: int = 5,
+        retry_delay: float = 0.5,
+    ) -> None:
+        self._repository = chat_message_repository
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        self._max_retries = max_retries
+        self._retry_delay = retry_delay
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self._writer: Optional[asyncio.Task] = None
+        self.persisted = 0
+        self.dropped = 0
+        self.failures = 0
+        self.flush_seconds = Histogram()
+        self.batch_size = Histogram(BATCH_SIZE_BUCKETS)
+
+    async def put(
+        self,
+        room_id: int,
+        sender_id: int,
+        message: BaseMessage,
+        log_id: Optional[str] = None,
+    ) -> None:
+        if self._writer is None:
+            self._writer = asyncio.create_task(self._write())
+        await self._queue.put(
+            {
+                "message_id": message.id,
+                "room_id": room_id,
+                "sender_id": sender_id,
+                "type": message.type.value,
+                "text": message.text,
+                "target_message_id": message.target_message_id,
+                "log_id": log_id,
+                "created_at": message.timestamp,
+            }
+        )
+
+    async def _collect(self) -> List[Dict[str, Any]]:
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self._flush_interval
+        while len(batch) < self._batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _flush(self, batch: List[Dict[str, Any]]) -> None:
+        loop = asyncio.get_running_loop()
+        for attempt in range(self._max_retries + 1):
+            started = time.perf_counter()
+            try:
+                await loop.run_in_executor(None, self._repository.create_all, batch)
+            except Exception as exc:
+                self.failures += 1
+                if self._rejected(exc):
+                    await self._isolate(batch, exc)
+                    return
+                logger.warning(f"Flushing {len(batch)} messages failed: {exc!r}")
+                if attempt < self._max_retries:
+                    await asyncio.sleep(self._retry_delay * 2**attempt)
+                continue
+            self.flush_seconds.observe(time.perf_counter() - started)
+            self.batch_size.observe(len(batch))
+            self.persisted += len(batch)
+            return
+        self.dropped += len(batch)
+        logger.error(f"Dropped {len(batch)} messages after {self._max_retries} retries")
+
+    @staticmethod
+    def _rejected(exc: Exception) -> bool:
+        if isinstance(exc, (OperationalError, InterfaceError)):
+            return False
+        if isinstance(exc, DBAPIError):
+            return not exc.connection_invalidated
+        return isinstance(exc, StatementError)
+
+    async def _isolate(self, batch: List[Dict[str, Any]], exc: StatementError) -> None:
+        if len(batch) == 1:
+            self.dropped += 1
+            logger.error(f"Dropped message {batch[0]['message_id']!r}: {exc.orig!r}")
+            return
+        middle = len(batch) // 2
+        await self._flush(batch[:middle])
+        await self._flush(batch[middle:])
+
+    async def _write(self) -> None:
+        while True:
+            batch = await self._collect()
+            try:
+                await self._flush(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queued": self._queue.qsize(),
+            "capacity": self._queue.maxsize,
+            "persisted": self.persisted,
+            "dropped": self.dropped,
+            "failures": self.failures,
+            "flush_seconds": self.flush_seconds.snapshot(),
+            "batch_size": self.batch_size.snapshot(),
+        }
+
+    async def close(self, timeout: float = 10.0) -> None:
+        if self._writer is None:
+            return
+        with suppress(asyncio.TimeoutError):
+            await asyncio.wait_for(self._queue.join(), timeout)
+        self._writer.cancel()
+        with suppress(asyncio.CancelledError):
+            await self._writer
+        self._writer = None
@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from collections import Counter, defaultdict
+from contextlib import suppress
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    DefaultDict,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+)
+
+import orjson
+from common.database import Redis
+
+from .const import EphemeralType
+from .frame import Frame
+
+if TYPE_CHECKING:
+    from .pubsub import ChatHub
+
+logger = logging.getLogger(__name__)
+
+
+HEARTBEAT = """
+local now, expiry = tonumber(ARGV[1]), tonumber(ARGV[2])
+local online = {}
+for i = 3, #KEYS do
+    local key, channel, user_id = KEYS[i], ARGV[2 * i - 3], ARGV[2 * i - 2]
+    local score = tonumber(redis.call('ZSCORE', key, user_id))
+    if not score or score < now then
+        online[#online + 1] = channel
+        online[#online + 1] = user_id
+    end
+    if not score or score < expiry then
+        redis.call('ZADD', key, expiry, user_id)
+        redis.call('ZADD', KEYS[1], expiry, channel .. '|' .. user_id)
+    end
+    local user_score = tonumber(redis.call('ZSCORE', KEYS[2], user_id))
+    if not user_score or user_score < expiry then
+        redis.call('ZADD', KEYS[2], expiry, user_id)
+    end
+end
+return online
+"""
+
+REAP = """
+local now = tonumber(ARGV[1])
+local offline = {}
+for i = 2, #KEYS do
+    local key, entry = KEYS[i], ARGV[i]
+    local expires = tonumber(redis.call('ZSCORE', KEYS[1], entry))
+    if expires and expires <= now then
+        local separator = string.find(entry, '|', 1, true)
+        local channel, user_id = string.sub(entry, 1, separator - 1), string.sub(entry, separator + 1)
+        local score = tonumber(redis.call('ZSCORE', key, user_id))
+        if score and score <= now then
+            redis.call('ZREM', key, user_id)
+            offline[#offline + 1] = channel
+            offline[#offline + 1] = user_id
+        end
+        redis.call('ZREM', KEYS[1], entry)
+    end
+end
+return offline
+"""
+
+
+class PresenceService:
+    EXPIRY_KEY = "presence:expiry"
+    USERS_KEY = "presence:users"
+
+    def __init__(
+        self,
+        hub: ChatHub,
+        redis: Redis,
+        ttl: float = 30.0,
+        heartbeat_interval: float = 10.0,
+        tick: float = 1.0,
+        batch_size: int = 1000,
+    ) -> None:
+        self._hub = hub
+        self._redis = redis
+        self._heartbeat = redis.connection.register_script(HEARTBEAT)
+        self._reap = redis.connection.register_script(REAP)
+        self._ttl = ttl
+        self._heartbeat_interval = heartbeat_interval
+        self._tick = tick
+        self._batch_size = batch_size
+        self._local: DefaultDict[str, Counter] = defaultdict(Counter)
+        self._fresh: Set[Tuple[str, int]] = set()
+        self._last_heartbeat = 0.0
+        self._ticker: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def key(channel: str) -> str:
+        return f"{channel}:presence"
+
+    def join(self, channel: str, user_id: int) -> None:
+        self._local[channel][user_id] += 1
+        self._fresh.add((channel, user_id))
+        if self._ticker is None:
+            self._ticker = asyncio.create_task(self._run())
+
+    def leave(self, channel: str, user_id: int) -> None:
+        connections = self._local[channel]
+        connections[user_id] -= 1
+        if connections[user_id] <= 0:
+            del connections[user_id]
+            self._fresh.discard((channel, user_id))
+        if not connections:
+            del self._local[channel]
+
+    async def get_room(self, channel: str) -> List[int]:
+        user_ids = await self._redis.connection.zrangebyscore(
+            self.key(channel), time.time(), "+inf"
+        )
+        return [int(user_id) for user_id in user_ids]
+
+    async def get_users(self, user_ids: Iterable[int]) -> Dict[int, bool]:
+        user_ids = list(user_ids)
+        if not user_ids:
+            return {}
+        now = time.time()
+        async with self._redis.connection.pipeline(transaction=False) as pipe:
+            for user_id in user_ids:
+                pipe.zscore(self.USERS_KEY, user_id)
+            scores = await pipe.execute()
+        return {
+            user_id: score is not None and score > now
+            for user_id, score in zip(user_ids, scores)
+        }
+
+    async def count(self) -> int:
+        return await self._redis.connection.zcount(self.USERS_KEY, time.time(), "+inf")
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.tick()
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                logger.warning(f"Presence tick failed: {exc!r}")
+            await asyncio.sleep(self._tick)
+
+    async def tick(self) -> None:
+        now = time.time()
+        if now - self._last_heartbeat >= self._heartbeat_interval:
+            beating = [
+                (channel, user_id)
+                for channel, connections in self._local.items()
+                for user_id in connections
+            ]
+            self._last_heartbeat = now
+        else:
+            beating = list(self._fresh)
+        self._fresh.clear()
+
+        async with self._redis.connection.pipeline(transaction=False) as pipe:
+            for start in range(0, len(beating), self._batch_size):
+                keys = [self.EXPIRY_KEY, self.USERS_KEY]
+                args: List = [now, now + self._ttl]
+                for channel, user_id in beating[start : start + self._batch_size]:
+                    keys.append(self.key(channel))
+                    args.extend((channel, user_id))
+                await self._heartbeat(keys=keys, args=args, client=pipe)
+            pipe.zrangebyscore(
+                self.EXPIRY_KEY, "-inf", now, start=0, num=self._batch_size
+            )
+            pipe.zremrangebyscore(self.USERS_KEY, "-inf", now)
+            *heartbeats, expired, _ = await pipe.execute()
+
+        reaped: List[bytes] = []
+        if expired:
+            keys = [self.EXPIRY_KEY]
+            keys.extend(self.key(entry.partition(b"|")[0].decode()) for entry in expired)
+            reaped = await self._reap(keys=keys, args=[now, *expired])
+
+        diffs: DefaultDict[str, Dict[str, Any]] = defaultdict(
+            lambda: {"online": [], "offline": []}
+        )
+        for online in heartbeats:
+            for channel, user_id in self._pairs(online):
+                diffs[channel]["online"].append(user_id)
+        for channel, user_id in self._pairs(reaped):
+            diffs[channel]["offline"].append(user_id)
+        await self._hub.notify_many(
+            (channel, Frame(orjson.dumps({"type": EphemeralType.PRESENCE, **diff})))
+            for channel, diff in diffs.items()
+        )
+
+    @staticmethod
+    def _pairs(changes: List[bytes]) -> Iterator[Tuple[str, int]]:
+        for i in range(0, len(changes), 2):
+            yield changes[i].decode(), int(changes[i + 1])
+
+    async def close(self) -> None:
+        if self._ticker is not None:
+            self._ticker.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._ticker
+            self._ticker = None
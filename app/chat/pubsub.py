@@ -1,84 +1,370 @@
 # -*- coding: utf-8 -*-
+from __future__ import annotations
+
 import asyncio
-import json
 import logging
+from contextlib import suppress
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Set, Tuple
 
-import aioredis
-from aioredis.client import PubSub, Redis
-from fastapi.encoders import jsonable_encoder
+from common.database import Redis
 from fastapi.websockets import WebSocketDisconnect
+from pydantic import ValidationError
 
-from .const import MessageReceiverType, MessageType
-from .message import SystemMessage, UserMessage
+from .affinity import RoomAffinity
+from .broker import Broker, RedisBroker
+from .compression import PayloadCodec
+from .const import EphemeralType, MessageReceiverType, MessageType, RateLimitAction
+from .cursor import ReadCursorStore
+from .errors import InvalidFrameError
+from .frame import Frame
+from .indicator import TypingIndicator
+from .message import ReadAck, SystemMessage, UserMessage
+from .persister import MessagePersister
+from .presence import PresenceService
+from .ratelimit import RateLimiter
 from .socket_handler import SocketHandler
+from .unread import UnreadCounter
 
 logger = logging.getLogger(__name__)
 
 
-class ChatServer:
-    def __init__(self, dsn: str) -> None:
-        self.dsn = dsn
+APPEND_AND_PUBLISH = """
+local seq
+if ARGV[3] ~= '' then
+    seq = redis.call('INCR', KEYS[3])
+    redis.call('HSET', KEYS[4], ARGV[3], seq)
+else
+    seq = redis.call('GET', KEYS[3]) or 0
+end
+local log_id = redis.call(
+    'XADD', KEYS[1], 'MAXLEN', '~', ARGV[1], '*', 'p', ARGV[2], 's', seq
+)
+if ARGV[4] == '1' then
+    redis.call('PUBLISH', KEYS[2], log_id .. ' ' .. ARGV[2])
+end
+return log_id
+"""
+
 
-    async def get_connection_pool(self) -> Redis:
-        connection = await aioredis.from_url(
-            self.dsn, encoding="utf-8", decode_responses=True
+class ChatHub:
+    RECONNECT_DELAY = 1.0
+    CODEC_KEY = "chat:codec"
+
+    def __init__(
+        self,
+        redis: Redis,
+        broker: Optional[Broker] = None,
+        codec: Optional[PayloadCodec] = None,
+        log_maxlen: int = 10000,
+        replay_concurrency: int = 16,
+    ) -> None:
+        self._redis = redis
+        self.broker = broker or RedisBroker(redis)
+        self._codec = codec or PayloadCodec()
+        self._log_maxlen = log_maxlen
+        self._append_and_publish = redis.connection.register_script(APPEND_AND_PUBLISH)
+        self.replay_slots = asyncio.Semaphore(replay_concurrency)
+        self._reader: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+        self._subscribed = asyncio.Event()
+        self.channels: Dict[str, Set[SocketHandler]] = {}
+
+    async def start(self) -> None:
+        connection = self._redis.connection
+        if self._codec.fingerprint:
+            await connection.set(self.CODEC_KEY, self._codec.fingerprint, nx=True)
+        fingerprint = (await connection.get(self.CODEC_KEY) or b"").decode()
+        if fingerprint != self._codec.fingerprint:
+            raise RuntimeError(
+                f"Chat payloads use dictionary {fingerprint or None!r}, this replica "
+                f"uses {self._codec.fingerprint or None!r}; set the same "
+                f"REDIS_PAYLOAD_DICTIONARY on every replica"
+            )
+
+    def subscribers(self, channel: str) -> int:
+        return len(self.channels.get(channel, ()))
+
+    @staticmethod
+    def channel_name(room_id: int) -> str:
+        return f"chat:{room_id}"
+
+    @staticmethod
+    def log_key(channel: str) -> str:
+        return f"{channel}:log"
+
+    async def publish(
+        self,
+        channel: str,
+        frame: Frame,
+        sender_id: Optional[int] = None,
+        local: bool = False,
+    ) -> str:
+        broadcast = not local and self.broker.shares_redis
+        payload = self._codec.encode(frame.data)
+        log_id = await self._append_and_publish(
+            keys=[
+                self.log_key(channel),
+                channel,
+                UnreadCounter.seq_key(channel),
+                UnreadCounter.key(channel),
+            ],
+            args=[
+                self._log_maxlen,
+                payload,
+                "" if sender_id is None else sender_id,
+                1 if broadcast else 0,
+            ],
         )
-        return connection
+        if not local and not broadcast:
+            await self.broker.publish(channel, log_id + b" " + payload)
+        frame.log_id = log_id.decode()
+        if local:
+            await self._deliver(channel, Frame.from_payload(frame.data, frame.log_id))
+        return frame.log_id
+
+    async def notify(self, channel: str, frame: Frame) -> None:
+        await self.broker.publish(channel, self._codec.encode(frame.data))
+
+    async def notify_many(self, frames: Iterable[Tuple[str, Frame]]) -> None:
+        await self.broker.publish_many(
+            (channel, self._codec.encode(frame.data)) for channel, frame in frames
+        )
+
+    async def history(
+        self, channel: str, after: str, count: int = 100
+    ) -> AsyncIterator[List[Frame]]:
+        while True:
+            entries = await self._redis.connection.xrange(
+                self.log_key(channel), min=f"({after}", max="+", count=count
+            )
+            if not entries:
+                return
+            frames = [
+                frame
+                for frame in (
+                    self._decode(fields[b"p"], log_id.decode())
+                    for log_id, fields in entries
+                )
+                if frame is not None
+            ]
+            if frames:
+                yield frames
+            if len(entries) < count:
+                return
+            after = entries[-1][0].decode()
+
+    async def subscribe(self, channel: str, socket: SocketHandler) -> None:
+        async with self._lock:
+            sockets = self.channels.setdefault(channel, set())
+            sockets.add(socket)
+            if len(sockets) == 1:
+                await self.broker.subscribe(channel)
+                self._subscribed.set()
+            if self._reader is None or self._reader.done():
+                self._reader = asyncio.create_task(self._read())
+
+    async def unsubscribe(self, channel: str, socket: SocketHandler) -> None:
+        async with self._lock:
+            sockets = self.channels.get(channel)
+            if not sockets or socket not in sockets:
+                return
+            sockets.remove(socket)
+            if not sockets:
+                del self.channels[channel]
+                await self.broker.unsubscribe(channel)
+
+    async def _read(self) -> None:
+        while True:
+            await self._subscribed.wait()
+            try:
+                async for channel, data in self.broker.listen():
+                    await self._dispatch(channel, data)
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                logger.exception(f"Unexpected Exception: {exc}")
+                await asyncio.sleep(self.RECONNECT_DELAY)
+                await self._resubscribe()
+                continue
+            if not self.channels:
+                self._subscribed.clear()
+
+    async def _resubscribe(self) -> None:
+        async with self._lock:
+            try:
+                await self.broker.resubscribe(self.channels)
+            except Exception as exc:
+                logger.warning(f"Can't resubscribe {list(self.channels)!r}: {exc!r}")
+
+    def _decode(self, payload: bytes, log_id: Optional[str] = None) -> Optional[Frame]:
+        try:
+            return Frame.from_payload(self._codec.decode(payload), log_id=log_id)
+        except Exception as exc:
+            logger.warning(
+                f"Skip undecodable payload {log_id or payload[:16]!r}: {exc!r}"
+            )
+            return None
+
+    async def _dispatch(self, channel: str, data: bytes) -> None:
+        log_id: Optional[str] = None
+        if data[:1].isdigit():
+            raw_id, _, data = data.partition(b" ")
+            log_id = raw_id.decode()
+        frame = self._decode(data, log_id)
+        if frame is not None:
+            await self._deliver(channel, frame)
+
+    async def _deliver(self, channel: str, frame: Frame) -> None:
+        for socket in list(self.channels.get(channel, ())):
+            try:
+                await socket.send(frame)
+            except Exception as exc:
+                logger.warning(f"Can't deliver to {socket.user_name!r}: {exc!r}")
+
+    def stats(self) -> Dict[str, List[Dict[str, Any]]]:
+        return {
+            channel: sorted(
+                (socket.stats() for socket in sockets),
+                key=lambda stats: stats["depth"],
+                reverse=True,
+            )
+            for channel, sockets in self.channels.items()
+        }
 
-    def get_pubsub(self, connection: Redis) -> PubSub:
-        return connection.pubsub()
+    async def close(self) -> None:
+        if self._reader is not None:
+            self._reader.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._reader
+        await self.broker.close()
+        await self._redis.close()
 
-    async def init(self, name: str, user_socket: SocketHandler) -> None:
-        self.connection = await self.get_connection_pool()
-        self.pubsub = self.get_pubsub(self.connection)
+
+class ChatServer:
+    def __init__(
+        self,
+        hub: ChatHub,
+        persister: MessagePersister,
+        cursors: ReadCursorStore,
+        presence: PresenceService,
+        typing: TypingIndicator,
+        limiter: RateLimiter,
+        affinity: RoomAffinity,
+        replay_batch_size: int = 100,
+    ) -> None:
+        self.hub = hub
+        self.persister = persister
+        self.cursors = cursors
+        self.presence = presence
+        self.typing = typing
+        self.limiter = limiter
+        self.affinity = affinity
+        self.replay_batch_size = replay_batch_size
+
+    async def init(self, name: str, room_id: int, user_socket: SocketHandler) -> None:
         self.user_socket = user_socket
         self.name = name
+        self.room_id = room_id
+        self.bucket = self.limiter.bucket()
+        self.ephemeral_bucket = self.limiter.ephemeral_bucket()
 
     async def publish(self) -> None:
         try:
             while True:
-                message = await self.user_socket.receive()
-                if message:
-                    new_message = UserMessage(**message)
-                    await self.connection.publish(
-                        self.name, json.dumps(jsonable_encoder(new_message))
-                    )
+                try:
+                    await self.receive()
+                except (InvalidFrameError, ValidationError) as exc:
+                    await self.invalid(exc)
         except WebSocketDisconnect as exc:
             logger.info(f"{self.user_socket.user_name!r} is disconnected")
             logger.debug(f"Disconnect {exc}")
 
-    async def subscribe(self) -> None:
-        await self.pubsub.subscribe(self.name)
-        try:
-            while True:
-                message = await self.pubsub.get_message(ignore_subscribe_messages=True)
-                if message:
-                    await self.user_socket.send(message["data"])
-        except Exception as exc:
-            logger.exception(f"Unexpected Exception: {exc}")
+    async def receive(self) -> None:
+        message = await self.user_socket.receive()
+        if not message or message.get("type") == EphemeralType.PONG:
+            return
+        if message.get("type") in (EphemeralType.TYPING, MessageType.READ):
+            if self.limiter.allow_ephemeral(self.ephemeral_bucket):
+                self.receive_ephemeral(message)
+        elif not self.limiter.allow_local(self.bucket):
+            await self.reject()
+        else:
+            await self.send(UserMessage(**message))
 
-    async def connect(self, send_welcome_message: bool) -> None:
-        publish_task = self.publish()
-        subscribe_task = self.subscribe()
+    async def invalid(self, exc: Exception) -> None:
+        logger.debug(f"Skip a frame from {self.user_socket.user_name!r}: {exc!r}")
+        if not self.limiter.allow_local(self.bucket):
+            return
+        error_message = SystemMessage(
+            text="잘못된 형식의 메시지입니다.",
+            type=MessageType.SYSTEM,
+            receiver=MessageReceiverType.USER,
+        )
+        await self.user_socket.send(Frame.from_message(error_message))
 
-        if send_welcome_message:
-            welcome_message = SystemMessage(
-                text=f"{self.user_socket.user_name!r}님이 입장하셨습니다.",
-                type=MessageType.NOTIFICATION,
-                receiver=MessageReceiverType.USER,
-            )
-            serialized_text = json.dumps(jsonable_encoder(welcome_message))
-            await self.connection.publish(self.name, serialized_text)
-            await self.user_socket.send(serialized_text)
+    def receive_ephemeral(self, message: Dict) -> None:
+        if message["type"] == EphemeralType.TYPING:
+            self.typing.typing(self.name, self.user_socket.user_id)
+        else:
+            ack = ReadAck(**message)
+            self.cursors.ack(self.name, self.user_socket.user_id, ack.log_id)
+
+    async def send(self, message: UserMessage) -> None:
+        if not await self.limiter.allow_cluster(self.name, self.user_socket.user_id):
+            await self.reject()
+            return
+        log_id = await self.hub.publish(
+            self.name,
+            Frame.from_message(message),
+            sender_id=self.user_socket.user_id,
+            local=self.affinity.delivers_locally(self.room_id),
+        )
+        await self.persister.put(self.room_id, self.user_socket.user_id, message, log_id)
 
-        done, pending = await asyncio.wait(
-            [publish_task, subscribe_task],
-            return_when=asyncio.FIRST_COMPLETED,
+    async def reject(self) -> None:
+        if self.limiter.action != RateLimitAction.ERROR:
+            return
+        error_message = SystemMessage(
+            text="메시지를 너무 빠르게 보내고 있습니다. 잠시 후 다시 시도해주세요.",
+            type=MessageType.SYSTEM,
+            receiver=MessageReceiverType.USER,
         )
+        await self.user_socket.send(Frame.from_message(error_message))
+
+    async def subscribe(self) -> None:
+        await self.hub.subscribe(self.name, self.user_socket)
 
-        for task in done:
-            logger.debug(f"done task: {task}")
+    async def unsubscribe(self) -> None:
+        await self.hub.unsubscribe(self.name, self.user_socket)
 
-        for task in pending:
-            logger.debug(f"pending task: {task}")
-            task.cancel()
+    async def catch_up(self, last_log_id: str) -> None:
+        async with self.hub.replay_slots:
+            async for frames in self.hub.history(
+                self.name, after=last_log_id, count=self.replay_batch_size
+            ):
+                await self.user_socket.replay(frames)
+                last_log_id = frames[-1].log_id
+        self.user_socket.release(after=last_log_id)
+
+    async def connect(
+        self, send_welcome_message: bool, last_log_id: Optional[str] = None
+    ) -> None:
+        if last_log_id is not None:
+            self.user_socket.hold()
+        await self.subscribe()
+        self.presence.join(self.name, self.user_socket.user_id)
+        try:
+            if last_log_id is not None:
+                await self.catch_up(last_log_id)
+            if send_welcome_message:
+                welcome_message = SystemMessage(
+                    text=f"{self.user_socket.user_name!r}님이 입장하셨습니다.",
+                    type=MessageType.NOTIFICATION,
+                    receiver=MessageReceiverType.USER,
+                )
+                await self.hub.publish(self.name, Frame.from_message(welcome_message))
+            await self.publish()
+        finally:
+            await self.unsubscribe()
+            self.presence.leave(self.name, self.user_socket.user_id)
+            self.user_socket.abort()
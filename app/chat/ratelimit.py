@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+
+import logging
+import time
+from collections import Counter
+from typing import Any, Dict
+
+from common.database import Redis
+from common.metrics import Histogram
+
+from .const import RateLimitAction
+
+logger = logging.getLogger(__name__)
+
+
+TAKE_TOKENS = """
+local now = tonumber(ARGV[1])
+local levels = {}
+for i = 1, #KEYS do
+    local rate, burst = tonumber(ARGV[i * 2]), tonumber(ARGV[i * 2 + 1])
+    local bucket = redis.call('HMGET', KEYS[i], 'tokens', 'updated')
+    local tokens = tonumber(bucket[1]) or burst
+    local updated = tonumber(bucket[2]) or now
+    levels[i] = math.min(burst, tokens + math.max(0, now - updated) * rate)
+    if levels[i] < 1 then
+        return i
+    end
+end
+for i = 1, #KEYS do
+    local rate, burst = tonumber(ARGV[i * 2]), tonumber(ARGV[i * 2 + 1])
+    redis.call('HSET', KEYS[i], 'tokens', levels[i] - 1, 'updated', now)
+    redis.call('PEXPIRE', KEYS[i], math.ceil(burst / rate * 1000) + 1000)
+end
+return 0
+"""
+
+
+class TokenBucket:
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate: float, burst: float) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self) -> bool:
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class RateLimiter:
+    def __init__(
+        self,
+        redis: Redis,
+        rate: float = 10.0,
+        burst: float = 20.0,
+        action: RateLimitAction = RateLimitAction.ERROR,
+        cluster: bool = False,
+        user_rate: float = 20.0,
+        user_burst: float = 40.0,
+        room_rate: float = 200.0,
+        room_burst: float = 400.0,
+        ephemeral_rate: float = 20.0,
+        ephemeral_burst: float = 40.0,
+    ) -> None:
+        self._redis = redis
+        self._take_tokens = redis.connection.register_script(TAKE_TOKENS)
+        self.rate = rate
+        self.burst = burst
+        self.action = RateLimitAction(action)
+        self.cluster = cluster
+        self._user_limit = (user_rate, user_burst)
+        self._room_limit = (room_rate, room_burst)
+        self._ephemeral_limit = (ephemeral_rate, ephemeral_burst)
+        self.decisions: Counter = Counter()
+        self.cluster_seconds = Histogram()
+
+    def bucket(self) -> TokenBucket:
+        return TokenBucket(self.rate, self.burst)
+
+    def ephemeral_bucket(self) -> TokenBucket:
+        return TokenBucket(*self._ephemeral_limit)
+
+    def allow_local(self, bucket: TokenBucket) -> bool:
+        if bucket.take():
+            return True
+        self.decisions["denied_connection"] += 1
+        return False
+
+    def allow_ephemeral(self, bucket: TokenBucket) -> bool:
+        if bucket.take():
+            return True
+        self.decisions["dropped_ephemeral"] += 1
+        return False
+
+    async def allow_cluster(self, channel: str, user_id: int) -> bool:
+        if not self.cluster:
+            self.decisions["allowed"] += 1
+            return True
+        started = time.perf_counter()
+        try:
+            denied = await self._take_tokens(
+                keys=[f"ratelimit:user:{user_id}", f"ratelimit:{channel}"],
+                args=[time.time(), *self._user_limit, *self._room_limit],
+            )
+        except Exception as exc:
+            logger.warning(f"Cluster rate limit unavailable, allowing: {exc!r}")
+            self.decisions["allowed_unchecked"] += 1
+            return True
+        finally:
+            self.cluster_seconds.observe(time.perf_counter() - started)
+        if denied:
+            self.decisions["denied_user" if denied == 1 else "denied_room"] += 1
+            return False
+        self.decisions["allowed"] += 1
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "action": self.action,
+            "cluster": self.cluster,
+            "decisions": dict(self.decisions),
+            "cluster_seconds": self.cluster_seconds.snapshot(),
+        }
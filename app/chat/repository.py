@@ -1,10 +1,12 @@
 # -*- coding: utf-8 -*-
 from __future__ import annotations
 
-from contextlib import AbstractContextManager
-from typing import Callable, Iterator
+from contextlib import AbstractAsyncContextManager, AbstractContextManager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set
 
+from sqlalchemy import exists, insert, select
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from user.models import User
 
@@ -14,7 +16,7 @@ from .errors import (
     ChatRoomNotFoundByIdError,
     UserIsNotChatRoomMemberError,
 )
-from .models import ChatRoom, ChatRoomMember
+from .models import ChatMessage, ChatRoom, ChatRoomMember
 
 
 class ChatRoomRepository:
@@ -91,6 +93,14 @@ class ChatRoomMemberRepository:
                 .all()
             )
 
+    def exists(self, room_id: int, user_id: int) -> bool:
+        with self.session_factory() as session:
+            return session.query(
+                exists().where(
+                    ChatRoomMember.room_id == room_id, ChatRoomMember.user_id == user_id
+                )
+            ).scalar()
+
     def create(self, room_id: int, user_id: int) -> ChatRoomMember:
         try:
             with self.session_factory() as session:
@@ -115,3 +125,164 @@ class ChatRoomMemberRepository:
                 raise UserIsNotChatRoomMemberError(room_id=room_id, user_id=user_id)
             session.delete(joined_member)
             session.commit()
+
+
+class AsyncChatRoomRepository:
+    def __init__(
+        self, session_factory: Callable[..., AbstractAsyncContextManager[AsyncSession]]
+    ) -> None:
+        self.session_factory = session_factory
+
+    async def get_all(self) -> List[ChatRoom]:
+        async with self.session_factory() as session:
+            return (await session.execute(select(ChatRoom))).scalars().all()
+
+    async def get_all_members(self, room_id: int) -> Iterator[User]:
+        async with self.session_factory() as session:
+            if await session.get(ChatRoom, room_id) is None:
+                raise ChatRoomNotFoundByIdError(room_id=room_id)
+            members = await session.execute(
+                select(User)
+                .join(ChatRoomMember, ChatRoomMember.user_id == User.id)
+                .where(ChatRoomMember.room_id == room_id)
+                .order_by(ChatRoomMember.id)
+            )
+            return iter(members.scalars().all())
+
+    async def get_all_joined_room(self, user_id: int) -> Iterator[ChatRoom]:
+        async with self.session_factory() as session:
+            joined_rooms = await session.execute(
+                select(ChatRoom)
+                .join(ChatRoomMember, ChatRoomMember.room_id == ChatRoom.id)
+                .where(ChatRoomMember.user_id == user_id)
+                .order_by(ChatRoomMember.id)
+            )
+            return iter(joined_rooms.scalars().all())
+
+    async def get_by_id(self, room_id: int) -> Optional[ChatRoom]:
+        async with self.session_factory() as session:
+            return await session.get(ChatRoom, room_id)
+
+    async def get_by_name(self, name: str) -> Optional[ChatRoom]:
+        async with self.session_factory() as session:
+            rooms = await session.execute(select(ChatRoom).where(ChatRoom.name == name))
+            return rooms.scalars().first()
+
+    async def create(self, owner: int, name: str, description: str = None) -> ChatRoom:
+        try:
+            async with self.session_factory() as session:
+                new_room = ChatRoom(owner=owner, name=name, description=description)
+                session.add(new_room)
+                await session.commit()
+                await session.refresh(new_room)
+                return new_room
+        except IntegrityError:
+            raise CannotCreateChatRoomError(name=name)
+
+    async def delete_by_room_id(self, room_id: int) -> None:
+        async with self.session_factory() as session:
+            room = await session.get(ChatRoom, room_id)
+            if not room:
+                raise ChatRoomNotFoundByIdError(room_id=room_id)
+            await session.delete(room)
+            await session.commit()
+
+
+class AsyncChatRoomMemberRepository:
+    def __init__(
+        self, session_factory: Callable[..., AbstractAsyncContextManager[AsyncSession]]
+    ) -> None:
+        self.session_factory = session_factory
+
+    async def get_all_by_room_id(self, room_id: int) -> List[ChatRoomMember]:
+        async with self.session_factory() as session:
+            members = await session.execute(
+                select(ChatRoomMember).where(ChatRoomMember.room_id == room_id)
+            )
+            return members.scalars().all()
+
+    async def get_all_by_user_id(self, user_id: int) -> List[ChatRoomMember]:
+        async with self.session_factory() as session:
+            members = await session.execute(
+                select(ChatRoomMember).where(ChatRoomMember.user_id == user_id)
+            )
+            return members.scalars().all()
+
+    async def get_user_ids(self, room_id: int) -> Set[int]:
+        async with self.session_factory() as session:
+            user_ids = await session.execute(
+                select(ChatRoomMember.user_id).where(ChatRoomMember.room_id == room_id)
+            )
+            return set(user_ids.scalars().all())
+
+    async def exists(self, room_id: int, user_id: int) -> bool:
+        async with self.session_factory() as session:
+            return await session.scalar(
+                select(
+                    exists().where(
+                        ChatRoomMember.room_id == room_id,
+                        ChatRoomMember.user_id == user_id,
+                    )
+                )
+            )
+
+    async def create(self, room_id: int, user_id: int) -> ChatRoomMember:
+        try:
+            async with self.session_factory() as session:
+                joined_new_member = ChatRoomMember(room_id=room_id, user_id=user_id)
+                session.add(joined_new_member)
+                await session.commit()
+                await session.refresh(joined_new_member)
+                return joined_new_member
+        except IntegrityError:
+            raise CannotJoinChatRoomError(room_id=room_id, user_id=user_id)
+
+    async def delete_by_user_id(self, room_id: int, user_id: int) -> None:
+        async with self.session_factory() as session:
+            joined_member = (
+                (
+                    await session.execute(
+                        select(ChatRoomMember).where(
+                            ChatRoomMember.room_id == room_id,
+                            ChatRoomMember.user_id == user_id,
+                        )
+                    )
+                )
+                .scalars()
+                .first()
+            )
+            if not joined_member:
+                raise UserIsNotChatRoomMemberError(room_id=room_id, user_id=user_id)
+            await session.delete(joined_member)
+            await session.commit()
+
+
+class ChatMessageRepository:
+    def __init__(
+        self, session_factory: Callable[..., AbstractContextManager[Session]]
+    ) -> None:
+        self.session_factory = session_factory
+
+    def get_page(
+        self, room_id: int, before: Optional[int] = None, limit: int = 50
+    ) -> List[Dict[str, Any]]:
+        query = select(
+            ChatMessage.id,
+            ChatMessage.message_id,
+            ChatMessage.log_id,
+            ChatMessage.sender_id,
+            ChatMessage.type,
+            ChatMessage.text,
+            ChatMessage.target_message_id,
+            ChatMessage.created_at,
+        ).where(ChatMessage.room_id == room_id)
+        if before is not None:
+            query = query.where(ChatMessage.id < before)
+        query = query.order_by(ChatMessage.id.desc()).limit(limit)
+        with self.session_factory() as session:
+            return [dict(row) for row in session.execute(query).mappings()]
+
+    def create_all(self, messages: List[Dict[str, Any]]) -> None:
+        with self.session_factory() as session:
+            session.execute(insert(ChatMessage), messages)
+            session.commit()
@@ -1,20 +1,42 @@
 # -*- coding: utf-8 -*-
 
 import logging
-from typing import Union
+from typing import Callable, List, Optional, Union
 
 from chat.socket_handler import SocketHandler
 from common.container import ApplicationContainer
+from common.database import AsyncPostgreSQL, PostgreSQL
 from common.response import ErrorResponse
 from dependency_injector.wiring import Provide, inject
-from fastapi import APIRouter, Depends, Header, Response, WebSocket, status
+from fastapi import (
+    APIRouter,
+    Depends,
+    Header,
+    HTTPException,
+    Query,
+    Response,
+    WebSocket,
+    status,
+)
 from fastapi.encoders import jsonable_encoder
 from fastapi.responses import JSONResponse
+from starlette.concurrency import run_in_threadpool
 from user.response import User
 
-from .pubsub import ChatServer
+from .affinity import RoomAffinity
+from .const import REDIRECT_CLOSE_CODE
+from .cursor import ReadCursorStore
+from .drain import ConnectionDrainer
+from .errors import UserIsNotChatRoomMemberError
+from .heartbeat import HeartbeatMonitor
+from .membership import MembershipCache
+from .persister import MessagePersister
+from .presence import PresenceService
+from .pubsub import ChatHub, ChatServer
+from .ratelimit import RateLimiter
 from .request import CreateChatRoom
-from .service import ChatRoomMemberService, ChatRoomService
+from .service import AsyncChatRoomMemberService, AsyncChatRoomService, ChatMessageService
+from .unread import UnreadCounter
 
 from common.authenticate import Session  # isort:skip
 
@@ -22,21 +44,30 @@ logger = logging.getLogger(__name__)
 router = APIRouter()
 CHAT_ROOM_TAGS = "Chat Room"
 CHAT_ROOM_MEMBER_TAGS = "Chat Room Members"
+CHAT_MESSAGE_TAGS = "Chat Messages"
+PRESENCE_TAGS = "Presence"
 
 
 @router.get("/healthz")
-async def healthz() -> Response:
+@inject
+async def healthz(
+    drainer: ConnectionDrainer = Depends(Provide[ApplicationContainer.redis.drainer]),
+) -> Response:
+    if drainer.draining:
+        return Response(status_code=status.HTTP_503_SERVICE_UNAVAILABLE)
     return Response(status_code=status.HTTP_200_OK)
 
 
 @router.get("/rooms", tags=[CHAT_ROOM_TAGS])
 @inject
 async def get_all_chat_rooms(
-    chat_room: ChatRoomService = Depends(Provide[ApplicationContainer.service.chat_room]),
+    chat_room: AsyncChatRoomService = Depends(
+        Provide[ApplicationContainer.service.async_chat_room]
+    ),
     x_session_id: str = Header(...),
     current_user: User = Depends(Session.verify),
 ) -> JSONResponse:
-    all_chat_rooms = chat_room.get_all()
+    all_chat_rooms = await chat_room.get_all()
     return JSONResponse(jsonable_encoder(all_chat_rooms), status_code=status.HTTP_200_OK)
 
 
@@ -44,13 +75,17 @@ async def get_all_chat_rooms(
 @inject
 async def create_chat_room(
     create_chat_room: CreateChatRoom,
-    chat_room: ChatRoomService = Depends(Provide[ApplicationContainer.service.chat_room]),
+    chat_room: AsyncChatRoomService = Depends(
+        Provide[ApplicationContainer.service.async_chat_room]
+    ),
+    unread: UnreadCounter = Depends(Provide[ApplicationContainer.redis.unread]),
     x_session_id: str = Header(...),
     current_user: User = Depends(Session.verify),
 ) -> JSONResponse:
     try:
-        new_chat_room = chat_room.create(**create_chat_room.dict())
-        chat_room.join(room_id=new_chat_room.id, user=current_user)
+        new_chat_room = await chat_room.create(**create_chat_room.dict())
+        await chat_room.join(room_id=new_chat_room.id, user=current_user)
+        await unread.track(ChatHub.channel_name(new_chat_room.id), current_user.id)
     except Exception as exception:
         error = ErrorResponse(
             error_message="Can't create chat room",
@@ -68,12 +103,16 @@ async def create_chat_room(
 @inject
 async def delete_chat_room_by_id(
     room_id: int,
-    chat_room: ChatRoomService = Depends(Provide[ApplicationContainer.service.chat_room]),
+    chat_room: AsyncChatRoomService = Depends(
+        Provide[ApplicationContainer.service.async_chat_room]
+    ),
+    unread: UnreadCounter = Depends(Provide[ApplicationContainer.redis.unread]),
     x_session_id: str = Header(...),
     current_user: User = Depends(Session.verify),
 ) -> Union[JSONResponse, Response]:
     try:
-        chat_room.delete_by_id(room_id=room_id)
+        await chat_room.delete_by_id(room_id=room_id)
+        await unread.drop(ChatHub.channel_name(room_id))
     except Exception as exception:
         error = ErrorResponse(
             error_message="Can't delete chat room",
@@ -89,16 +128,18 @@ async def delete_chat_room_by_id(
 @inject
 async def join_chat_room(
     room_id: int,
-    chat_room_member: ChatRoomMemberService = Depends(
-        Provide[ApplicationContainer.service.chat_room_member]
+    chat_room_member: AsyncChatRoomMemberService = Depends(
+        Provide[ApplicationContainer.service.async_chat_room_member]
     ),
+    unread: UnreadCounter = Depends(Provide[ApplicationContainer.redis.unread]),
     x_session_id: str = Header(...),
     current_user: User = Depends(Session.verify),
 ) -> JSONResponse:
     try:
-        new_chat_room_member = chat_room_member.join(
+        new_chat_room_member = await chat_room_member.join(
             room_id=room_id, user_id=current_user.id
         )
+        await unread.track(ChatHub.channel_name(room_id), current_user.id)
     except Exception as exception:
         error = ErrorResponse(
             error_message="Can't join the chat room",
@@ -116,14 +157,14 @@ async def join_chat_room(
 @inject
 async def get_all_chat_room_members(
     room_id: int,
-    chat_room_service: ChatRoomService = Depends(
-        Provide[ApplicationContainer.service.chat_room]
+    chat_room_service: AsyncChatRoomService = Depends(
+        Provide[ApplicationContainer.service.async_chat_room]
     ),
     x_session_id: str = Header(...),
     current_user: User = Depends(Session.verify),
 ) -> JSONResponse:
     try:
-        all_members = chat_room_service.get_all_joined_members(room_id=room_id)
+        all_members = await chat_room_service.get_all_joined_members(room_id=room_id)
         users = [User(**member.__dict__) for member in all_members]
     except Exception as exception:
         error = ErrorResponse(
@@ -140,14 +181,16 @@ async def get_all_chat_room_members(
 @inject
 async def leave_chat_room(
     room_id: int,
-    chat_room_member: ChatRoomMemberService = Depends(
-        Provide[ApplicationContainer.service.chat_room_member]
+    chat_room_member: AsyncChatRoomMemberService = Depends(
+        Provide[ApplicationContainer.service.async_chat_room_member]
     ),
+    unread: UnreadCounter = Depends(Provide[ApplicationContainer.redis.unread]),
     x_session_id: str = Header(...),
-    current_user: Session = Depends(Session.verify),
+    current_user: User = Depends(Session.verify),
 ) -> Union[Response, JSONResponse]:
     try:
-        chat_room_member.leave(room_id=room_id, user_id=current_user.id)
+        await chat_room_member.leave(room_id=room_id, user_id=current_user.id)
+        await unread.forget(ChatHub.channel_name(room_id), current_user.id)
     except Exception as exception:
         error = ErrorResponse(
             error_message="Can't leave chat room",
@@ -159,18 +202,127 @@ async def leave_chat_room(
     return Response(status_code=status.HTTP_200_OK)
 
 
+@router.get("/rooms/{room_id}/messages", tags=[CHAT_MESSAGE_TAGS])
+@inject
+async def get_chat_room_messages(
+    room_id: int,
+    before: Optional[int] = Query(None, ge=1),
+    limit: int = Query(50, ge=1, le=200),
+    chat_message: ChatMessageService = Depends(
+        Provide[ApplicationContainer.service.chat_message]
+    ),
+    x_session_id: str = Header(...),
+    current_user: User = Depends(Session.verify),
+) -> Union[JSONResponse, Response]:
+    try:
+        history = await run_in_threadpool(
+            chat_message.get_history,
+            room_id=room_id,
+            user_id=current_user.id,
+            before=before,
+            limit=limit,
+        )
+    except UserIsNotChatRoomMemberError as exception:
+        error = ErrorResponse(
+            error_message="Can't inquire chat room messages",
+            detail=exception.__repr__(),
+        )
+        return JSONResponse(
+            jsonable_encoder(error), status_code=status.HTTP_403_FORBIDDEN
+        )
+    except Exception as exception:
+        error = ErrorResponse(
+            error_message="Can't inquire chat room messages",
+            detail=exception.__repr__(),
+        )
+        return JSONResponse(
+            jsonable_encoder(error), status_code=status.HTTP_400_BAD_REQUEST
+        )
+    return Response(history, media_type="application/json")
+
+
+@router.get("/rooms/{room_id}/cursors", tags=[CHAT_MESSAGE_TAGS])
+@inject
+async def get_chat_room_read_cursors(
+    room_id: int,
+    log_id: Optional[str] = Query(None, regex=r"^\d+-\d+$"),
+    chat_room_member: AsyncChatRoomMemberService = Depends(
+        Provide[ApplicationContainer.service.async_chat_room_member]
+    ),
+    read_cursors: ReadCursorStore = Depends(
+        Provide[ApplicationContainer.redis.read_cursors]
+    ),
+    x_session_id: str = Header(...),
+    current_user: User = Depends(Session.verify),
+) -> JSONResponse:
+    if not await chat_room_member.is_member(room_id=room_id, user_id=current_user.id):
+        error = ErrorResponse(
+            error_message="Can't inquire chat room read cursors",
+            detail=UserIsNotChatRoomMemberError(room_id, current_user.id).__repr__(),
+        )
+        return JSONResponse(
+            jsonable_encoder(error), status_code=status.HTTP_403_FORBIDDEN
+        )
+    channel = ChatHub.channel_name(room_id)
+    if log_id is not None:
+        readers = await read_cursors.get_readers(channel, log_id=log_id)
+        return JSONResponse(readers, status_code=status.HTTP_200_OK)
+    cursors = await read_cursors.get_all(channel)
+    return JSONResponse(jsonable_encoder(cursors), status_code=status.HTTP_200_OK)
+
+
+@router.get("/rooms/{room_id}/presence", tags=[PRESENCE_TAGS])
+@inject
+async def get_chat_room_presence(
+    room_id: int,
+    chat_room_member: AsyncChatRoomMemberService = Depends(
+        Provide[ApplicationContainer.service.async_chat_room_member]
+    ),
+    presence: PresenceService = Depends(Provide[ApplicationContainer.redis.presence]),
+    x_session_id: str = Header(...),
+    current_user: User = Depends(Session.verify),
+) -> JSONResponse:
+    if not await chat_room_member.is_member(room_id=room_id, user_id=current_user.id):
+        error = ErrorResponse(
+            error_message="Can't inquire chat room presence",
+            detail=UserIsNotChatRoomMemberError(room_id, current_user.id).__repr__(),
+        )
+        return JSONResponse(
+            jsonable_encoder(error), status_code=status.HTTP_403_FORBIDDEN
+        )
+    online = await presence.get_room(ChatHub.channel_name(room_id))
+    return JSONResponse(online, status_code=status.HTTP_200_OK)
+
+
+@router.get("/presence", tags=[PRESENCE_TAGS])
+@inject
+async def get_users_presence(
+    user_id: List[int] = Query(..., max_items=1000),
+    presence: PresenceService = Depends(Provide[ApplicationContainer.redis.presence]),
+    x_session_id: str = Header(...),
+    current_user: User = Depends(Session.verify),
+) -> JSONResponse:
+    online = await presence.get_users(user_id)
+    return JSONResponse(jsonable_encoder(online), status_code=status.HTTP_200_OK)
+
+
 @router.get("/rooms/me", tags=[CHAT_ROOM_MEMBER_TAGS])
 @inject
 async def get_all_chat_rooms_i_joined(
-    chat_room_service: ChatRoomService = Depends(
-        Provide[ApplicationContainer.service.chat_room]
+    chat_room_service: AsyncChatRoomService = Depends(
+        Provide[ApplicationContainer.service.async_chat_room]
     ),
+    unread: UnreadCounter = Depends(Provide[ApplicationContainer.redis.unread]),
     x_session_id: str = Header(...),
     current_user: User = Depends(Session.verify),
 ) -> JSONResponse:
     try:
-        joind_all_chat_rooms = chat_room_service.get_all_joined_chat_rooms(
-            user_id=current_user.id
+        joind_all_chat_rooms = list(
+            await chat_room_service.get_all_joined_chat_rooms(user_id=current_user.id)
+        )
+        unread_counts = await unread.get_counts(
+            [ChatHub.channel_name(room.id) for room in joind_all_chat_rooms],
+            user_id=current_user.id,
         )
     except Exception as exception:
         error = ErrorResponse(
@@ -181,29 +333,172 @@ async def get_all_chat_rooms_i_joined(
             jsonable_encoder(error), status_code=status.HTTP_400_BAD_REQUEST
         )
     return JSONResponse(
-        jsonable_encoder(list(joind_all_chat_rooms)), status_code=status.HTTP_200_OK
+        [
+            {**jsonable_encoder(room), "unread": count}
+            for room, count in zip(joind_all_chat_rooms, unread_counts)
+        ],
+        status_code=status.HTTP_200_OK,
     )
 
 
+@router.get("/ws/stats", tags=[CHAT_ROOM_TAGS])
+@inject
+async def get_socket_stats(
+    chat_hub: ChatHub = Depends(Provide[ApplicationContainer.redis.chat_hub]),
+    drainer: ConnectionDrainer = Depends(Provide[ApplicationContainer.redis.drainer]),
+    x_admin_token: str = Header(...),
+) -> JSONResponse:
+    if not drainer.authorized(x_admin_token):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Forbidden")
+    return JSONResponse(chat_hub.stats(), status_code=status.HTTP_200_OK)
+
+
+@router.get("/ws/heartbeat/stats", tags=[CHAT_ROOM_TAGS])
+@inject
+async def get_heartbeat_stats(
+    heartbeat: HeartbeatMonitor = Depends(Provide[ApplicationContainer.chat.heartbeat]),
+    x_session_id: str = Header(...),
+    current_user: User = Depends(Session.verify),
+) -> JSONResponse:
+    return JSONResponse(heartbeat.stats(), status_code=status.HTTP_200_OK)
+
+
+@router.post("/ws/drain", tags=[CHAT_ROOM_TAGS])
+@inject
+async def drain_connections(
+    drainer: ConnectionDrainer = Depends(Provide[ApplicationContainer.redis.drainer]),
+    x_admin_token: str = Header(...),
+) -> JSONResponse:
+    if not drainer.authorized(x_admin_token):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Forbidden")
+    drainer.drain()
+    return JSONResponse(drainer.stats(), status_code=status.HTTP_202_ACCEPTED)
+
+
+@router.get("/ws/drain/stats", tags=[CHAT_ROOM_TAGS])
+@inject
+async def get_drain_stats(
+    drainer: ConnectionDrainer = Depends(Provide[ApplicationContainer.redis.drainer]),
+    x_session_id: str = Header(...),
+    current_user: User = Depends(Session.verify),
+) -> JSONResponse:
+    return JSONResponse(drainer.stats(), status_code=status.HTTP_200_OK)
+
+
+@router.get("/messages/stats", tags=[CHAT_ROOM_TAGS])
+@inject
+async def get_message_persister_stats(
+    message_persister: MessagePersister = Depends(
+        Provide[ApplicationContainer.service.message_persister]
+    ),
+    x_session_id: str = Header(...),
+    current_user: User = Depends(Session.verify),
+) -> JSONResponse:
+    return JSONResponse(message_persister.stats(), status_code=status.HTTP_200_OK)
+
+
+@router.get("/membership/stats", tags=[CHAT_ROOM_MEMBER_TAGS])
+@inject
+async def get_membership_cache_stats(
+    membership: MembershipCache = Depends(
+        Provide[ApplicationContainer.service.membership]
+    ),
+    x_session_id: str = Header(...),
+    current_user: User = Depends(Session.verify),
+) -> JSONResponse:
+    return JSONResponse(membership.stats(), status_code=status.HTTP_200_OK)
+
+
+@router.get("/db/stats", tags=[CHAT_ROOM_TAGS])
+@inject
+async def get_database_stats(
+    database: PostgreSQL = Depends(Provide[ApplicationContainer.db.postgres]),
+    async_database: AsyncPostgreSQL = Depends(
+        Provide[ApplicationContainer.db.async_postgres]
+    ),
+    x_session_id: str = Header(...),
+    current_user: User = Depends(Session.verify),
+) -> JSONResponse:
+    return JSONResponse(
+        {"sync": database.metrics.stats(), "async": async_database.metrics.stats()},
+        status_code=status.HTTP_200_OK,
+    )
+
+
+@router.get("/rooms/{room_id}/owner", tags=[CHAT_ROOM_TAGS])
+@inject
+async def get_chat_room_owner(
+    room_id: int,
+    affinity: RoomAffinity = Depends(Provide[ApplicationContainer.redis.affinity]),
+    x_session_id: str = Header(...),
+    current_user: User = Depends(Session.verify),
+) -> JSONResponse:
+    return JSONResponse(
+        {
+            "room_id": room_id,
+            "enabled": affinity.enabled,
+            "owner": affinity.owner(room_id),
+            "local": affinity.owns(room_id),
+            "settled": affinity.settled,
+        },
+        status_code=status.HTTP_200_OK,
+    )
+
+
+@router.get("/ratelimit/stats", tags=[CHAT_ROOM_TAGS])
+@inject
+async def get_rate_limit_stats(
+    limiter: RateLimiter = Depends(Provide[ApplicationContainer.redis.limiter]),
+    x_session_id: str = Header(...),
+    current_user: User = Depends(Session.verify),
+) -> JSONResponse:
+    return JSONResponse(limiter.stats(), status_code=status.HTTP_200_OK)
+
+
 @router.websocket("/ws/rooms/{room_id}")
 @inject
 async def chat_with_other_users(
     socket: WebSocket,
     room_id: int,
-    x_session_id: str,
-    chat_room_service: ChatRoomService = Depends(
-        Provide[ApplicationContainer.service.chat_room],
+    x_session_id: Optional[str] = None,
+    last_log_id: Optional[str] = Query(None, regex=r"^\d+-\d+$"),
+    resume_token: Optional[str] = None,
+    chat_room_service: AsyncChatRoomService = Depends(
+        Provide[ApplicationContainer.service.async_chat_room],
     ),
     chat_server: ChatServer = Depends(
         Provide[ApplicationContainer.redis.chat_server],
     ),
+    socket_handler: Callable[..., SocketHandler] = Depends(
+        Provide[ApplicationContainer.chat.socket_handler.provider],
+    ),
+    affinity: RoomAffinity = Depends(Provide[ApplicationContainer.redis.affinity]),
+    drainer: ConnectionDrainer = Depends(Provide[ApplicationContainer.redis.drainer]),
 ) -> None:
-    current_user = Session.verify_by_session_id(session_id=x_session_id)
-    user = SocketHandler(socket=socket, user=current_user)
-    channel_name = f"chat:{str(room_id)}"
-    if not chat_room_service.is_member(room_id=room_id, user=current_user):
+    if drainer.draining:
+        await drainer.refuse(socket)
+        return
+    resumed = await drainer.resume(resume_token) if resume_token else None
+    if resumed is not None and resumed.room_id == room_id:
+        x_session_id = resumed.session_id or x_session_id
+        last_log_id = resumed.last_log_id or last_log_id
+    else:
+        resumed = None
+    current_user = await Session.verify_by_session_id(session_id=x_session_id)
+    if not await chat_room_service.is_member(room_id=room_id, user=current_user):
         raise
+    user = socket_handler(socket=socket, user=current_user, session_id=x_session_id)
+    channel_name = ChatHub.channel_name(room_id)
     await user.connect()
+    if drainer.draining:
+        await user.disconnect(code=drainer.CLOSE_CODE, reason=drainer.close_reason())
+        return
+    if not affinity.owns(room_id):
+        await user.disconnect(code=REDIRECT_CLOSE_CODE, reason=affinity.owner(room_id))
+        return
 
-    await chat_server.init(name=channel_name, user_socket=user)
-    await chat_server.connect(send_welcome_message=True)
+    await chat_server.init(name=channel_name, room_id=room_id, user_socket=user)
+    await chat_server.connect(
+        send_welcome_message=resumed is None and last_log_id is None,
+        last_log_id=last_log_id,
+    )
@@ -1,9 +1,10 @@
 # -*- coding: utf-8 -*-
 from __future__ import annotations
 
-from typing import Any, Dict, Iterator, List, Optional
+import logging
+from typing import Any, Dict, Iterable, Iterator, List, Optional
 
-from fastapi.encoders import jsonable_encoder
+import orjson
 from rich import inspect
 from user.models import User as UserModel
 from user.response import User
@@ -15,11 +16,21 @@ from .errors import (
     ChatRoomNotFoundByIdError,
     UserIsNotChatRoomMemberError,
 )
+from .frame import Frame
+from .membership import MembershipCache
 from .message import BaseMessage, SystemMessage
 from .models import ChatRoom, ChatRoomMember
-from .repository import ChatRoomMemberRepository, ChatRoomRepository
+from .repository import (
+    AsyncChatRoomMemberRepository,
+    AsyncChatRoomRepository,
+    ChatMessageRepository,
+    ChatRoomMemberRepository,
+    ChatRoomRepository,
+)
 from .socket_handler import SocketHandler
 
+logger = logging.getLogger(__name__)
+
 
 class ChatRoomService:
     __instance: Optional[ChatRoomService] = None
@@ -42,7 +53,7 @@ class ChatRoomService:
     def update(self) -> ChatRoomService:
         old_rooms = self.__instance.rooms
         new_rooms = self.get_all()
-        self.__instance.rooms = dict.fromkeys([room.id for room in new_rooms], [])
+        self.__instance.rooms = {room.id: [] for room in new_rooms}
         self.__instance.rooms.update(old_rooms)
         return self.__instance
 
@@ -93,8 +104,7 @@ class ChatRoomService:
         )
 
     def is_member(self, room_id: int, user: User) -> bool:
-        members = self._repository.get_all_members(room_id=room_id)
-        return any(member.id == user.id for member in members)
+        return self._member_repository.exists(room_id=room_id, user_id=user.id)
 
     async def enter(self, room_id: int, user: SocketHandler) -> None:
         await user.connect()
@@ -109,17 +119,35 @@ class ChatRoomService:
     def exit(self, room_id: int, user: SocketHandler) -> None:
         self.__instance.rooms[room_id].remove(user)
 
+    def evict(self, room_id: int, users: Iterable[SocketHandler]) -> None:
+        evicted = set(users)
+        self.__instance.rooms[room_id] = [
+            user for user in self.__instance.rooms[room_id] if user not in evicted
+        ]
+
     async def broadcast(self, room_id: int, message: BaseMessage) -> None:
-        for user in self.__instance.rooms[room_id]:
-            await user.send(jsonable_encoder(message))
+        await self.fan_out(room_id, list(self.__instance.rooms[room_id]), message)
 
     async def send(
         self, room_id: int, sender: SocketHandler, message: BaseMessage
     ) -> None:
-        for user in self.__instance.rooms[room_id]:
-            if user == sender:
-                continue
-            await user.send(jsonable_encoder(message))
+        recipients = [user for user in self.__instance.rooms[room_id] if user != sender]
+        await self.fan_out(room_id, recipients, message)
+
+    async def fan_out(
+        self, room_id: int, recipients: List[SocketHandler], message: BaseMessage
+    ) -> List[SocketHandler]:
+        frame = Frame.from_message(message)
+        failed = []
+        for user in recipients:
+            try:
+                await user.send(frame)
+            except Exception:
+                failed.append(user)
+        if failed:
+            logger.info(f"Evict {len(failed)} socket(s) from ChatRoom(id={room_id!r})")
+            self.evict(room_id=room_id, users=failed)
+        return failed
 
 
 class ChatRoomMemberService:
@@ -155,11 +183,114 @@ class ChatRoomMemberService:
         return self._repository.delete_by_user_id(room_id=room_id, user_id=user_id)
 
     def is_member(self, room_id: int, user_id: int) -> bool:
-        joined_all_members = self.get_all_joined_members(room_id=room_id)
-        is_joined = [member.user_id == user_id for member in joined_all_members]
-        if any(is_joined):
-            return True
-        return False
+        return self._repository.exists(room_id=room_id, user_id=user_id)
+
+
+class AsyncChatRoomService:
+    def __init__(
+        self,
+        chat_room_repository: AsyncChatRoomRepository,
+        chat_room_member_repository: AsyncChatRoomMemberRepository,
+        membership: MembershipCache,
+    ) -> None:
+        self._repository = chat_room_repository
+        self._member_repository = chat_room_member_repository
+        self._membership = membership
+
+    async def get_all(self) -> List[ChatRoom]:
+        return await self._repository.get_all()
+
+    async def get_by_id(self, room_id: int) -> Optional[ChatRoom]:
+        return await self._repository.get_by_id(room_id=room_id)
+
+    async def get_by_name(self, name: str) -> Optional[ChatRoom]:
+        return await self._repository.get_by_name(name=name)
+
+    async def create(self, owner: int, name: str, description: str) -> ChatRoom:
+        is_exist = await self.get_by_name(name=name)
+        if is_exist:
+            raise ChatRoomAlreadyExistError(name=name, description=description)
+        return await self._repository.create(
+            owner=owner, name=name, description=description
+        )
+
+    async def delete_by_id(self, room_id: int) -> None:
+        is_exist = await self.get_by_id(room_id=room_id)
+        if not is_exist:
+            raise ChatRoomNotFoundByIdError(room_id=room_id)
+        await self._repository.delete_by_room_id(room_id=room_id)
+        self._membership.drop(room_id)
+
+    async def get_all_joined_chat_rooms(self, user_id: int) -> Iterator[ChatRoom]:
+        return await self._repository.get_all_joined_room(user_id=user_id)
+
+    async def get_all_joined_members(self, room_id: int) -> Iterator[UserModel]:
+        return await self._repository.get_all_members(room_id=room_id)
+
+    async def join(self, room_id: int, user: User) -> ChatRoomMember:
+        if await self.is_member(room_id=room_id, user=user):
+            raise AlreadyJoinedError(room_id=room_id, user_id=user.id)
+        member = await self._member_repository.create(room_id=room_id, user_id=user.id)
+        self._membership.joined(room_id, user.id)
+        return member
+
+    async def is_member(self, room_id: int, user: User) -> bool:
+        return await self._membership.contains(room_id, user.id)
+
+
+class AsyncChatRoomMemberService:
+    def __init__(
+        self,
+        chat_room_repository: AsyncChatRoomRepository,
+        chat_room_member_repository: AsyncChatRoomMemberRepository,
+        membership: MembershipCache,
+    ) -> None:
+        self._chat_room_repository = chat_room_repository
+        self._repository = chat_room_member_repository
+        self._membership = membership
+
+    async def get_all_joined_chat_rooms(self, user_id: int) -> Iterator[ChatRoom]:
+        return await self._chat_room_repository.get_all_joined_room(user_id=user_id)
+
+    async def get_all_joined_members(self, room_id: int) -> List[ChatRoomMember]:
+        return await self._repository.get_all_by_room_id(room_id=room_id)
+
+    async def join(self, room_id: int, user_id: int) -> ChatRoomMember:
+        if await self.is_member(room_id=room_id, user_id=user_id):
+            raise AlreadyJoinedError(room_id=room_id, user_id=user_id)
+        member = await self._repository.create(room_id=room_id, user_id=user_id)
+        self._membership.joined(room_id, user_id)
+        return member
+
+    async def leave(self, room_id: int, user_id: int) -> None:
+        if not await self.is_member(room_id=room_id, user_id=user_id):
+            raise UserIsNotChatRoomMemberError(room_id=room_id, user_id=user_id)
+        try:
+            await self._repository.delete_by_user_id(room_id=room_id, user_id=user_id)
+        finally:
+            self._membership.left(room_id, user_id)
+
+    async def is_member(self, room_id: int, user_id: int) -> bool:
+        return await self._membership.contains(room_id, user_id)
+
+
+class ChatMessageService:
+    def __init__(
+        self,
+        chat_message_repository: ChatMessageRepository,
+        chat_room_member_repository: ChatRoomMemberRepository,
+    ) -> None:
+        self._repository = chat_message_repository
+        self._member_repository = chat_room_member_repository
+
+    def get_history(
+        self, room_id: int, user_id: int, before: Optional[int] = None, limit: int = 50
+    ) -> bytes:
+        if not self._member_repository.exists(room_id=room_id, user_id=user_id):
+            raise UserIsNotChatRoomMemberError(room_id=room_id, user_id=user_id)
+        return orjson.dumps(
+            self._repository.get_page(room_id=room_id, before=before, limit=limit)
+        )
 
 
 if __name__ == "__main__":
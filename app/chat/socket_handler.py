@@ -1,18 +1,67 @@
 # -*- coding: utf-8 -*-
 from __future__ import annotations
 
-from typing import Dict, Optional
+import asyncio
+import logging
+from collections import deque
+from contextlib import suppress
+from itertools import chain
+from typing import TYPE_CHECKING, Any, Deque, Dict, List, Optional
 
-from fastapi import WebSocket
+import msgpack
+import orjson
+from fastapi import WebSocket, status
+from fastapi.websockets import WebSocketDisconnect
 from user.response import User
 
+from .const import EphemeralType, OverflowPolicy, WireProtocol
+from .errors import InvalidFrameError
+from .frame import Frame, log_id_before, log_id_key
+
+if TYPE_CHECKING:
+    from .heartbeat import HeartbeatMonitor
+
+logger = logging.getLogger(__name__)
+
+PING = Frame(orjson.dumps({"type": EphemeralType.PING}), system=True)
+
 
 class SocketHandler:
     socket: Optional[WebSocket] = None
 
-    def __init__(self, socket: WebSocket, user: User) -> None:
+    def __init__(
+        self,
+        socket: WebSocket,
+        user: User,
+        queue_size: int = 256,
+        overflow_policy: OverflowPolicy = OverflowPolicy.DROP_OLDEST,
+        close_code: int = status.WS_1008_POLICY_VIOLATION,
+        send_timeout: Optional[float] = None,
+        heartbeat: Optional[HeartbeatMonitor] = None,
+        session_id: Optional[str] = None,
+    ) -> None:
         self.socket = socket
         self.__user = user
+        self.session_id = session_id
+        self.queue_size = queue_size
+        self.overflow_policy = OverflowPolicy(overflow_policy)
+        self.close_code = close_code
+        self.send_timeout = send_timeout
+        self.heartbeat = heartbeat
+        self.protocol = WireProtocol.JSON
+        self._outbox: Deque[Frame] = deque()
+        self._held: Optional[Deque[Frame]] = None
+        self._ready = asyncio.Event()
+        self._drained = asyncio.Event()
+        self._drained.set()
+        self._writer: Optional[asyncio.Task] = None
+        self._sending: Optional[Frame] = None
+        self._receiver: Optional[asyncio.Task] = None
+        self.last_seen = 0.0
+        self.last_log_id: Optional[str] = None
+        self.sent = 0
+        self.dropped = 0
+        self.high_watermark = 0
 
     @property
     def user_id(self) -> int:
@@ -30,20 +79,189 @@ class SocketHandler:
     def user_email(self) -> str:
         return self.__user.email
 
+    @property
+    def depth(self) -> int:
+        return len(self._outbox)
+
     async def connect(self) -> None:
         if self.socket is None:
             raise ValueError("socket is empty")
-        await self.socket.accept()
+        subprotocol = None
+        if WireProtocol.MSGPACK in self.socket.scope.get("subprotocols", ()):
+            self.protocol = subprotocol = WireProtocol.MSGPACK
+        await self.socket.accept(subprotocol=subprotocol)
+        self._writer = asyncio.create_task(self._write())
+        self.last_seen = asyncio.get_running_loop().time()
+        if self.heartbeat is not None:
+            self.heartbeat.watch(self)
 
-    async def disconnect(self) -> None:
-        await self.socket.close()
-        self.socket = None
+    async def disconnect(
+        self, code: int = status.WS_1000_NORMAL_CLOSURE, reason: Optional[str] = None
+    ) -> None:
+        socket = self._detach()
+        if socket is not None:
+            await socket.close(code=code, reason=reason)
 
-    async def send(self, text: str) -> None:
+    def _detach(self) -> Optional[WebSocket]:
+        if self._writer is not None:
+            self._writer.cancel()
+            self._writer = None
+        if self._receiver is not None and self._receiver is not asyncio.current_task():
+            self._receiver.cancel()
+        if self.heartbeat is not None:
+            self.heartbeat.unwatch(self)
+        socket, self.socket = self.socket, None
+        self._outbox.clear()
+        self._held = None
+        self._drained.set()
+        return socket
+
+    def abort(
+        self, code: int = status.WS_1000_NORMAL_CLOSURE, reason: Optional[str] = None
+    ) -> None:
+        socket = self._detach()
+        if socket is not None:
+            asyncio.create_task(self._close_quietly(socket, code, reason))
+
+    @staticmethod
+    async def _close_quietly(
+        socket: WebSocket, code: int, reason: Optional[str] = None
+    ) -> None:
+        with suppress(Exception):
+            await socket.close(code=code, reason=reason)
+
+    async def send(self, frame: Frame) -> None:
         if self.socket is None:
             raise ValueError("socket is empty")
-        await self.socket.send_text(text)
+        if self._held is not None:
+            if len(self._held) == self._held.maxlen:
+                self.dropped += 1
+            self._held.append(frame)
+            return
+        self._enqueue(frame)
+
+    def _enqueue(self, frame: Frame) -> None:
+        if len(self._outbox) >= self.queue_size and not self._make_room(frame.system):
+            return
+        self._outbox.append(frame)
+        self.high_watermark = max(self.high_watermark, len(self._outbox))
+        self._drained.clear()
+        self._ready.set()
+
+    def ping(self) -> None:
+        if self.socket is not None:
+            self._enqueue(PING)
+
+    def hold(self) -> None:
+        self._held = deque(maxlen=self.queue_size)
+
+    def release(self, after: Optional[str] = None) -> None:
+        held, self._held = self._held, None
+        for frame in held or ():
+            if after and frame.log_id and log_id_key(frame.log_id) <= log_id_key(after):
+                continue
+            self._enqueue(frame)
+
+    async def replay(self, frames: List[Frame]) -> None:
+        if self.socket is None:
+            raise ValueError("socket is empty")
+        for frame in frames:
+            self._enqueue(frame)
+        await self._drained.wait()
+
+    async def flush(self) -> None:
+        await self._drained.wait()
+
+    def resume_point(self) -> Optional[str]:
+        if self.last_log_id is not None:
+            return self.last_log_id
+        for frame in chain((self._sending,), self._outbox, self._held or ()):
+            if frame is not None and frame.log_id is not None:
+                return log_id_before(frame.log_id)
+        return None
+
+    def _make_room(self, system: bool) -> bool:
+        self.dropped += 1
+        if self.overflow_policy == OverflowPolicy.DISCONNECT:
+            logger.warning(f"{self.user_name!r} is too slow, disconnecting")
+            self.abort(self.close_code)
+            return False
+        if self.overflow_policy == OverflowPolicy.DROP_NON_SYSTEM:
+            if not system:
+                return False
+            for queued in self._outbox:
+                if not queued.system:
+                    self._outbox.remove(queued)
+                    return True
+        self._outbox.popleft()
+        return True
+
+    async def _write(self) -> None:
+        try:
+            while self.socket is not None:
+                if not self._outbox:
+                    self._drained.set()
+                    self._ready.clear()
+                    await self._ready.wait()
+                    continue
+                frame = self._sending = self._outbox.popleft()
+                if self.protocol == WireProtocol.MSGPACK:
+                    sending = self.socket.send_bytes(frame.packed)
+                else:
+                    sending = self.socket.send_text(frame.text)
+                await asyncio.wait_for(sending, self.send_timeout)
+                self._sending = None
+                self.sent += 1
+                if frame is not PING:
+                    self.last_seen = asyncio.get_running_loop().time()
+                if frame.log_id is not None:
+                    self.last_log_id = frame.log_id
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            logger.info(f"Stop writing to {self.user_name!r}: {exc!r}")
+            self._writer = None
+            self.abort(self.close_code)
 
     async def receive(self) -> Dict:
-        received = await self.socket.receive_json()
-        return received
+        socket = self.socket
+        if socket is None:
+            raise WebSocketDisconnect(code=self.close_code)
+        self._receiver = asyncio.current_task()
+        try:
+            if self.protocol == WireProtocol.MSGPACK:
+                data: Any = await socket.receive_bytes()
+            else:
+                data = await socket.receive_text()
+        except asyncio.CancelledError:
+            if self.socket is not None:
+                raise
+            raise WebSocketDisconnect(code=self.close_code)
+        except KeyError as exc:
+            raise InvalidFrameError(f"expected a {self.protocol} frame") from exc
+        finally:
+            self._receiver = None
+        self.last_seen = asyncio.get_running_loop().time()
+        try:
+            if self.protocol == WireProtocol.MSGPACK:
+                message = msgpack.unpackb(data)
+            else:
+                message = orjson.loads(data)
+        except (ValueError, TypeError, msgpack.UnpackException) as exc:
+            raise InvalidFrameError(repr(exc)) from exc
+        if not isinstance(message, dict) or not all(
+            isinstance(key, str) for key in message
+        ):
+            raise InvalidFrameError("expected an object")
+        return message
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "user_id": self.user_id,
+            "user_name": self.user_name,
+            "depth": self.depth,
+            "high_watermark": self.high_watermark,
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "protocol": self.protocol,
+        }
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+
+from typing import List
+
+from common.database import Redis
+
+TRACK = """
+local seq = redis.call('GET', KEYS[2]) or 0
+return redis.call('HSETNX', KEYS[1], ARGV[1], seq)
+"""
+
+
+class UnreadCounter:
+    def __init__(self, redis: Redis) -> None:
+        self._redis = redis
+        self._track = redis.connection.register_script(TRACK)
+
+    @staticmethod
+    def key(channel: str) -> str:
+        return f"{channel}:read_seq"
+
+    @staticmethod
+    def seq_key(channel: str) -> str:
+        return f"{channel}:seq"
+
+    async def track(self, channel: str, user_id: int) -> None:
+        await self._track(keys=[self.key(channel), self.seq_key(channel)], args=[user_id])
+
+    async def forget(self, channel: str, user_id: int) -> None:
+        await self._redis.connection.hdel(self.key(channel), user_id)
+
+    async def drop(self, channel: str) -> None:
+        await self._redis.connection.delete(self.key(channel), self.seq_key(channel))
+
+    async def get_counts(self, channels: List[str], user_id: int) -> List[int]:
+        if not channels:
+            return []
+        async with self._redis.connection.pipeline(transaction=False) as pipe:
+            for channel in channels:
+                pipe.get(self.seq_key(channel))
+                pipe.hget(self.key(channel), user_id)
+            values = await pipe.execute()
+        return [
+            0 if read is None else max(0, int(seq or 0) - int(read))
+            for seq, read in zip(values[::2], values[1::2])
+        ]
@@ -2,8 +2,10 @@
 from dependency_injector.wiring import Provide, inject
 from fastapi import Depends, HTTPException, status
 from starlette.requests import Request
+from user.cache import SessionCache
 from user.response import User
-from user.service import UserService, UserSessionService
+from user.service import AsyncUserService, AsyncUserSessionService
+from user.token import SessionTokens
 
 from .container import ApplicationContainer
 
@@ -11,39 +13,78 @@ from .container import ApplicationContainer
 class Session:
     @staticmethod
     @inject
-    def verify(
+    async def verify(
         request: Request,
-        user_service: UserService = Depends(Provide[ApplicationContainer.service.user]),
-        user_session_service: UserSessionService = Depends(
-            Provide[ApplicationContainer.service.user_session]
+        user_service: AsyncUserService = Depends(
+            Provide[ApplicationContainer.service.async_user]
+        ),
+        user_session_service: AsyncUserSessionService = Depends(
+            Provide[ApplicationContainer.service.async_user_session]
+        ),
+        session_cache: SessionCache = Depends(
+            Provide[ApplicationContainer.redis.session_cache]
+        ),
+        session_tokens: SessionTokens = Depends(
+            Provide[ApplicationContainer.redis.session_tokens]
         ),
     ) -> User:
         session_id: str = request.headers.get("x-session-id")
-        return Session.verify_by_session_id(
+        return await Session.verify_by_session_id(
             session_id=session_id,
             user_service=user_service,
             user_session_service=user_session_service,
+            session_cache=session_cache,
+            session_tokens=session_tokens,
         )
 
     @staticmethod
     @inject
-    def verify_by_session_id(
+    async def verify_by_session_id(
         session_id: str,
-        user_service: UserService = Depends(Provide[ApplicationContainer.service.user]),
-        user_session_service: UserSessionService = Depends(
-            Provide[ApplicationContainer.service.user_session]
+        user_service: AsyncUserService = Depends(
+            Provide[ApplicationContainer.service.async_user]
+        ),
+        user_session_service: AsyncUserSessionService = Depends(
+            Provide[ApplicationContainer.service.async_user_session]
+        ),
+        session_cache: SessionCache = Depends(
+            Provide[ApplicationContainer.redis.session_cache]
+        ),
+        session_tokens: SessionTokens = Depends(
+            Provide[ApplicationContainer.redis.session_tokens]
         ),
     ) -> User:
         if not session_id:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST, detail="Required Session id"
             )
-        user_session = user_session_service.get_by_session_id(session_id=session_id)
+        if session_tokens.owns(session_id):
+            user = await session_tokens.verify(session_id)
+            if user is None:
+                raise HTTPException(
+                    status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated"
+                )
+            return user
+        user = await session_cache.get(session_id)
+        if user is not None:
+            return user
+        generation = session_cache.generation
+        user = await Session.load(session_id, user_service, user_session_service)
+        await session_cache.put(session_id, user, generation)
+        return user
+
+    @staticmethod
+    async def load(
+        session_id: str,
+        user_service: AsyncUserService,
+        user_session_service: AsyncUserSessionService,
+    ) -> User:
+        user_session = await user_session_service.get_by_session_id(session_id=session_id)
         if not user_session:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated"
             )
-        user = user_service.get_by_id(id=user_session.user_id)
+        user = await user_service.get_by_id(id=user_session.user_id)
         if not user:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED, detail="Not logged in"
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+
+import math
+
+
+class BloomFilter:
+    def __init__(self, capacity: int, error_rate: float = 0.001) -> None:
+        capacity = max(1, capacity)
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def add(self, key: str) -> None:
+        digest = hash(key) & 0xFFFFFFFFFFFFFFFF
+        first, second = digest & 0xFFFFFFFF, digest >> 32 | 1
+        for i in range(self.hashes):
+            position = (first + i * second) % self.size
+            self._bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key: str) -> bool:
+        digest = hash(key) & 0xFFFFFFFFFFFFFFFF
+        first, second, size, bits = (
+            digest & 0xFFFFFFFF,
+            digest >> 32 | 1,
+            self.size,
+            self._bits,
+        )
+        for i in range(self.hashes):
+            position = (first + i * second) % size
+            if not bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
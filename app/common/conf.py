@@ -3,6 +3,7 @@ from __future__ import annotations
 
 import re
 import sys
+from socket import gethostname
 from typing import Any, Optional
 
 from hydra import compose, initialize
@@ -19,15 +20,113 @@ class DataBaseConfig(BaseSettings):
 
 
 class PostgreSQLConfig(DataBaseConfig):
+    POOL_SIZE: int = 5
+    MAX_OVERFLOW: int = 10
+    POOL_TIMEOUT: float = 30.0
+    POOL_RECYCLE: int = 1800
+    POOL_PRE_PING: bool = True
+    STATEMENT_TIMEOUT: int = 0
+    ECHO: bool = False
+
     class Config:
         env_prefix = "POSTGRESQL_"
 
 
 class RedisConfig(DataBaseConfig):
+    MAX_CONNECTIONS: int = 50
+    PAYLOAD_DICTIONARY: Optional[str] = None
+    LOG_MAXLEN: int = 10000
+
     class Config:
         env_prefix = "REDIS_"
 
 
+class ChatConfig(BaseSettings):
+    BROKER: str = "redis"
+    OUTBOUND_QUEUE_SIZE: int = 256
+    OVERFLOW_POLICY: str = "drop_oldest"
+    OVERFLOW_CLOSE_CODE: int = 1008
+    SEND_TIMEOUT: float = 5.0
+    HEARTBEAT_INTERVAL: float = 0.0
+    IDLE_TIMEOUT: float = 60.0
+    HEARTBEAT_TICK: float = 1.0
+    DRAIN_TIMEOUT: float = 10.0
+    DRAIN_RECONNECT_WINDOW: float = 30.0
+    RESUME_TTL: float = 120.0
+    ADMIN_TOKEN: str = ""
+    MEMBERSHIP_CACHE_TTL: float = 60.0
+    MEMBERSHIP_CACHE_ROOMS: int = 1000
+    REPLAY_BATCH_SIZE: int = 100
+    REPLAY_CONCURRENCY: int = 16
+    PERSIST_BATCH_SIZE: int = 500
+    PERSIST_FLUSH_INTERVAL: float = 0.05
+    PERSIST_QUEUE_SIZE: int = 10000
+    PERSIST_MAX_RETRIES: int = 5
+    PERSIST_RETRY_DELAY: float = 0.5
+    READ_FLUSH_INTERVAL: float = 0.5
+    PRESENCE_TTL: float = 30.0
+    PRESENCE_HEARTBEAT_INTERVAL: float = 10.0
+    PRESENCE_TICK: float = 1.0
+    PRESENCE_BATCH_SIZE: int = 1000
+    TYPING_WINDOW: float = 3.0
+    TYPING_TICK: float = 0.25
+    RATE_LIMIT_RATE: float = 10.0
+    RATE_LIMIT_BURST: float = 20.0
+    RATE_LIMIT_ACTION: str = "error"
+    CLUSTER_RATE_LIMIT: bool = False
+    USER_RATE_LIMIT_RATE: float = 20.0
+    USER_RATE_LIMIT_BURST: float = 40.0
+    ROOM_RATE_LIMIT_RATE: float = 200.0
+    ROOM_RATE_LIMIT_BURST: float = 400.0
+    EPHEMERAL_RATE_LIMIT_RATE: float = 20.0
+    EPHEMERAL_RATE_LIMIT_BURST: float = 40.0
+    ROOM_AFFINITY: bool = False
+    AFFINITY_ADDRESS: str = gethostname()
+    AFFINITY_TTL: float = 15.0
+    AFFINITY_REFRESH_INTERVAL: float = 5.0
+    AFFINITY_REPLICAS: int = 160
+    AFFINITY_SETTLE: float = 15.0
+
+    class Config:
+        env_prefix = "CHAT_"
+        env_file = ".env"
+        env_file_encoding = "utf-8"
+
+
+class SessionConfig(BaseSettings):
+    STORE: str = "sql"
+    TTL: float = 604800.0
+    CACHE_TTL: float = 30.0
+    CACHE_SIZE: int = 10000
+    SHARED_CACHE: bool = False
+    SHARED_CACHE_TTL: float = 300.0
+    TOKENS: bool = False
+    TOKEN_SECRET: str = ""
+    TOKEN_TTL: float = 3600.0
+    DENYLIST_CAPACITY: int = 100000
+    DENYLIST_ERROR_RATE: float = 0.001
+    DENYLIST_REFRESH_INTERVAL: float = 60.0
+
+    class Config:
+        env_prefix = "SESSION_"
+        env_file = ".env"
+        env_file_encoding = "utf-8"
+
+
+class WebSocketConfig(BaseSettings):
+    PER_MESSAGE_DEFLATE: bool = True
+    DEFLATE_WINDOW_BITS: int = 12
+    DEFLATE_MEMORY_LEVEL: int = 5
+    DEFLATE_LEVEL: int = 6
+    PING_INTERVAL: float = 20.0
+    PING_TIMEOUT: float = 20.0
+
+    class Config:
+        env_prefix = "WS_"
+        env_file = ".env"
+        env_file_encoding = "utf-8"
+
+
 class Config:
     __instance: Optional[Config] = None
     __cfg: Optional[DictConfig] = None
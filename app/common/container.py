@@ -1,37 +1,288 @@
 # -*- coding: utf-8 -*-
 from __future__ import annotations
 
-from chat.pubsub import ChatServer
-from chat.repository import ChatRoomMemberRepository, ChatRoomRepository
-from chat.service import ChatRoomMemberService, ChatRoomService
-from common.conf import PostgreSQLConfig, RedisConfig
-from common.database import PostgreSQL
+from chat.affinity import RoomAffinity
+from chat.broker import InProcessBroker, PostgresBroker, RedisBroker
+from chat.compression import load_codec
+from chat.cursor import ReadCursorStore
+from chat.drain import ConnectionDrainer
+from chat.heartbeat import HeartbeatMonitor
+from chat.indicator import TypingIndicator
+from chat.membership import MembershipCache
+from chat.persister import MessagePersister
+from chat.presence import PresenceService
+from chat.pubsub import ChatHub, ChatServer
+from chat.ratelimit import RateLimiter
+from chat.repository import (
+    AsyncChatRoomMemberRepository,
+    AsyncChatRoomRepository,
+    ChatMessageRepository,
+    ChatRoomMemberRepository,
+    ChatRoomRepository,
+)
+from chat.service import (
+    AsyncChatRoomMemberService,
+    AsyncChatRoomService,
+    ChatMessageService,
+    ChatRoomMemberService,
+    ChatRoomService,
+)
+from chat.socket_handler import SocketHandler
+from chat.unread import UnreadCounter
+from common.conf import ChatConfig, PostgreSQLConfig, RedisConfig, SessionConfig
+from common.database import AsyncPostgreSQL, BlockingRedis, PostgreSQL, Redis
 from dependency_injector import containers, providers
-from user.repository import UserRepository, UserSessionRepository
-from user.service import UserService, UserSessionService
+from user.cache import SessionCache
+from user.repository import (
+    AsyncUserRepository,
+    AsyncUserSessionRepository,
+    MigratingUserSessionRepository,
+    RedisUserSessionRepository,
+    ThreadedUserSessionRepository,
+    UserRepository,
+    UserSessionRepository,
+)
+from user.service import (
+    AsyncUserService,
+    AsyncUserSessionService,
+    UserService,
+    UserSessionService,
+)
+from user.token import SessionTokens
 
 
 class RedisContainer(containers.DeclarativeContainer):
     cfg = RedisConfig()
+    chat_cfg = ChatConfig()
+    session_cfg = SessionConfig()
 
-    chat_server = providers.Factory(ChatServer, dsn=cfg.DSN)
+    db = providers.DependenciesContainer()
+
+    service = providers.DependenciesContainer()
+
+    redis = providers.Singleton(Redis, dsn=cfg.DSN, max_connections=cfg.MAX_CONNECTIONS)
+
+    broker = providers.Selector(
+        providers.Object(chat_cfg.BROKER),
+        redis=providers.Singleton(RedisBroker, redis=redis),
+        memory=providers.Singleton(InProcessBroker),
+        postgres=providers.Singleton(PostgresBroker, database=db.postgres),
+    )
+
+    codec = providers.Singleton(load_codec, dictionary_path=cfg.PAYLOAD_DICTIONARY)
+
+    session_cache = providers.Singleton(
+        SessionCache,
+        redis=redis,
+        ttl=session_cfg.CACHE_TTL,
+        max_size=session_cfg.CACHE_SIZE,
+        shared=session_cfg.SHARED_CACHE,
+        shared_ttl=session_cfg.SHARED_CACHE_TTL,
+    )
+
+    session_tokens = providers.Singleton(
+        SessionTokens,
+        redis=redis,
+        enabled=session_cfg.TOKENS,
+        secret=session_cfg.TOKEN_SECRET,
+        ttl=session_cfg.TOKEN_TTL,
+        denylist_capacity=session_cfg.DENYLIST_CAPACITY,
+        denylist_error_rate=session_cfg.DENYLIST_ERROR_RATE,
+        refresh_interval=session_cfg.DENYLIST_REFRESH_INTERVAL,
+    )
+
+    chat_hub = providers.Singleton(
+        ChatHub,
+        redis=redis,
+        broker=broker,
+        codec=codec,
+        log_maxlen=cfg.LOG_MAXLEN,
+        replay_concurrency=chat_cfg.REPLAY_CONCURRENCY,
+    )
+
+    unread = providers.Singleton(UnreadCounter, redis=redis)
+
+    read_cursors = providers.Singleton(
+        ReadCursorStore,
+        hub=chat_hub,
+        redis=redis,
+        flush_interval=chat_cfg.READ_FLUSH_INTERVAL,
+    )
+
+    presence = providers.Singleton(
+        PresenceService,
+        hub=chat_hub,
+        redis=redis,
+        ttl=chat_cfg.PRESENCE_TTL,
+        heartbeat_interval=chat_cfg.PRESENCE_HEARTBEAT_INTERVAL,
+        tick=chat_cfg.PRESENCE_TICK,
+        batch_size=chat_cfg.PRESENCE_BATCH_SIZE,
+    )
+
+    typing = providers.Singleton(
+        TypingIndicator,
+        hub=chat_hub,
+        window=chat_cfg.TYPING_WINDOW,
+        tick=chat_cfg.TYPING_TICK,
+    )
+
+    limiter = providers.Singleton(
+        RateLimiter,
+        redis=redis,
+        rate=chat_cfg.RATE_LIMIT_RATE,
+        burst=chat_cfg.RATE_LIMIT_BURST,
+        action=chat_cfg.RATE_LIMIT_ACTION,
+        cluster=chat_cfg.CLUSTER_RATE_LIMIT,
+        user_rate=chat_cfg.USER_RATE_LIMIT_RATE,
+        user_burst=chat_cfg.USER_RATE_LIMIT_BURST,
+        room_rate=chat_cfg.ROOM_RATE_LIMIT_RATE,
+        room_burst=chat_cfg.ROOM_RATE_LIMIT_BURST,
+        ephemeral_rate=chat_cfg.EPHEMERAL_RATE_LIMIT_RATE,
+        ephemeral_burst=chat_cfg.EPHEMERAL_RATE_LIMIT_BURST,
+    )
+
+    affinity = providers.Singleton(
+        RoomAffinity,
+        hub=chat_hub,
+        redis=redis,
+        address=chat_cfg.AFFINITY_ADDRESS,
+        enabled=chat_cfg.ROOM_AFFINITY,
+        ttl=chat_cfg.AFFINITY_TTL,
+        refresh_interval=chat_cfg.AFFINITY_REFRESH_INTERVAL,
+        replicas=chat_cfg.AFFINITY_REPLICAS,
+        settle=chat_cfg.AFFINITY_SETTLE,
+    )
+
+    drainer = providers.Singleton(
+        ConnectionDrainer,
+        hub=chat_hub,
+        redis=redis,
+        timeout=chat_cfg.DRAIN_TIMEOUT,
+        reconnect_window=chat_cfg.DRAIN_RECONNECT_WINDOW,
+        resume_ttl=chat_cfg.RESUME_TTL,
+        admin_token=chat_cfg.ADMIN_TOKEN,
+    )
+
+    chat_server = providers.Factory(
+        ChatServer,
+        hub=chat_hub,
+        persister=service.message_persister,
+        cursors=read_cursors,
+        presence=presence,
+        typing=typing,
+        limiter=limiter,
+        affinity=affinity,
+        replay_batch_size=chat_cfg.REPLAY_BATCH_SIZE,
+    )
+
+
+class ChatContainer(containers.DeclarativeContainer):
+    cfg = ChatConfig()
+
+    heartbeat = providers.Singleton(
+        HeartbeatMonitor,
+        interval=cfg.HEARTBEAT_INTERVAL,
+        idle_timeout=cfg.IDLE_TIMEOUT,
+        tick=cfg.HEARTBEAT_TICK,
+    )
+
+    socket_handler = providers.Factory(
+        SocketHandler,
+        queue_size=cfg.OUTBOUND_QUEUE_SIZE,
+        overflow_policy=cfg.OVERFLOW_POLICY,
+        close_code=cfg.OVERFLOW_CLOSE_CODE,
+        send_timeout=cfg.SEND_TIMEOUT,
+        heartbeat=heartbeat,
+    )
 
 
 class DatabaseContainer(containers.DeclarativeContainer):
     cfg = PostgreSQLConfig()
+    redis_cfg = RedisConfig()
 
-    postgres = providers.Singleton(PostgreSQL, dsn=cfg.DSN)
+    postgres = providers.Singleton(
+        PostgreSQL,
+        dsn=cfg.DSN,
+        echo=cfg.ECHO,
+        pool_size=cfg.POOL_SIZE,
+        max_overflow=cfg.MAX_OVERFLOW,
+        pool_timeout=cfg.POOL_TIMEOUT,
+        pool_recycle=cfg.POOL_RECYCLE,
+        pool_pre_ping=cfg.POOL_PRE_PING,
+        statement_timeout=cfg.STATEMENT_TIMEOUT,
+    )
+
+    async_postgres = providers.Singleton(
+        AsyncPostgreSQL,
+        dsn=cfg.DSN,
+        echo=cfg.ECHO,
+        pool_size=cfg.POOL_SIZE,
+        max_overflow=cfg.MAX_OVERFLOW,
+        pool_timeout=cfg.POOL_TIMEOUT,
+        pool_recycle=cfg.POOL_RECYCLE,
+        pool_pre_ping=cfg.POOL_PRE_PING,
+        statement_timeout=cfg.STATEMENT_TIMEOUT,
+    )
+
+    redis = providers.Singleton(
+        BlockingRedis, dsn=redis_cfg.DSN, max_connections=redis_cfg.MAX_CONNECTIONS
+    )
 
 
 class RepositoryContainer(containers.DeclarativeContainer):
+    session_cfg = SessionConfig()
+
     db = providers.DependenciesContainer()
 
     user = providers.Factory(UserRepository, session_factory=db.postgres.provided.session)
 
-    user_session = providers.Factory(
+    sql_user_session = providers.Factory(
         UserSessionRepository, session_factory=db.postgres.provided.session
     )
 
+    redis_user_session = providers.Singleton(
+        RedisUserSessionRepository, redis=db.redis, ttl=session_cfg.TTL
+    )
+
+    migrating_user_session = providers.Factory(
+        MigratingUserSessionRepository,
+        source=sql_user_session,
+        target=redis_user_session,
+    )
+
+    user_session = providers.Selector(
+        providers.Object(session_cfg.STORE),
+        sql=sql_user_session,
+        redis=redis_user_session,
+        migrate=migrating_user_session,
+    )
+
+    async_user = providers.Factory(
+        AsyncUserRepository, session_factory=db.async_postgres.provided.session
+    )
+
+    async_user_session = providers.Selector(
+        providers.Object(session_cfg.STORE),
+        sql=providers.Factory(
+            AsyncUserSessionRepository, session_factory=db.async_postgres.provided.session
+        ),
+        redis=providers.Factory(
+            ThreadedUserSessionRepository, repository=redis_user_session
+        ),
+        migrate=providers.Factory(
+            ThreadedUserSessionRepository, repository=migrating_user_session
+        ),
+    )
+
+    async_chat_room = providers.Factory(
+        AsyncChatRoomRepository, session_factory=db.async_postgres.provided.session
+    )
+
+    async_chat_room_member = providers.Factory(
+        AsyncChatRoomMemberRepository,
+        session_factory=db.async_postgres.provided.session,
+    )
+
     chat_room = providers.Factory(
         ChatRoomRepository, session_factory=db.postgres.provided.session
     )
@@ -40,8 +291,14 @@ class RepositoryContainer(containers.DeclarativeContainer):
         ChatRoomMemberRepository, session_factory=db.postgres.provided.session
     )
 
+    chat_message = providers.Factory(
+        ChatMessageRepository, session_factory=db.postgres.provided.session
+    )
+
 
 class ServiceContainer(containers.DeclarativeContainer):
+    cfg = ChatConfig()
+
     repository = providers.DependenciesContainer()
 
     user = providers.Factory(UserService, user_repository=repository.user)
@@ -62,12 +319,59 @@ class ServiceContainer(containers.DeclarativeContainer):
         chat_room_repository=repository.chat_room,
     )
 
+    async_user = providers.Factory(
+        AsyncUserService, user_repository=repository.async_user
+    )
+
+    async_user_session = providers.Factory(
+        AsyncUserSessionService, user_session_repository=repository.async_user_session
+    )
+
+    membership = providers.Singleton(
+        MembershipCache,
+        chat_room_member_repository=repository.async_chat_room_member,
+        ttl=cfg.MEMBERSHIP_CACHE_TTL,
+        max_rooms=cfg.MEMBERSHIP_CACHE_ROOMS,
+    )
+
+    async_chat_room = providers.Factory(
+        AsyncChatRoomService,
+        chat_room_repository=repository.async_chat_room,
+        chat_room_member_repository=repository.async_chat_room_member,
+        membership=membership,
+    )
+
+    async_chat_room_member = providers.Factory(
+        AsyncChatRoomMemberService,
+        chat_room_member_repository=repository.async_chat_room_member,
+        chat_room_repository=repository.async_chat_room,
+        membership=membership,
+    )
+
+    chat_message = providers.Factory(
+        ChatMessageService,
+        chat_message_repository=repository.chat_message,
+        chat_room_member_repository=repository.chat_room_member,
+    )
+
+    message_persister = providers.Singleton(
+        MessagePersister,
+        chat_message_repository=repository.chat_message,
+        batch_size=cfg.PERSIST_BATCH_SIZE,
+        flush_interval=cfg.PERSIST_FLUSH_INTERVAL,
+        queue_size=cfg.PERSIST_QUEUE_SIZE,
+        max_retries=cfg.PERSIST_MAX_RETRIES,
+        retry_delay=cfg.PERSIST_RETRY_DELAY,
+    )
+
 
 class ApplicationContainer(containers.DeclarativeContainer):
     db = providers.Container(DatabaseContainer)
 
-    redis = providers.Container(RedisContainer)
-
     repository = providers.Container(RepositoryContainer, db=db)
 
     service = providers.Container(ServiceContainer, repository=repository)
+
+    redis = providers.Container(RedisContainer, db=db, service=service)
+
+    chat = providers.Container(ChatContainer)
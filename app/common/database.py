@@ -2,21 +2,116 @@
 from __future__ import annotations
 
 import logging
-from contextlib import AbstractContextManager, contextmanager
-from typing import Callable, Generator
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, AsyncGenerator, Callable, Dict, Generator, Union
 
-from sqlalchemy import create_engine
+import aioredis
+import redis  # type: ignore[import]
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import URL, Engine, make_url
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import Session, scoped_session, sessionmaker
 
+from .metrics import Histogram
+
 logger = logging.getLogger(__name__)
 
 Base = declarative_base()
 
+SATURATION_BUCKETS = (0.1, 0.25, 0.5, 0.75, 0.9, 1.0)
+
+
+def engine_options(
+    url: URL,
+    pool_size: int = 5,
+    max_overflow: int = 10,
+    pool_timeout: float = 30.0,
+    pool_recycle: int = 1800,
+    pool_pre_ping: bool = True,
+    statement_timeout: int = 0,
+) -> Dict[str, Any]:
+    options: Dict[str, Any] = {"pool_pre_ping": pool_pre_ping}
+    if url.get_backend_name() != "sqlite":
+        options.update(
+            pool_size=pool_size,
+            max_overflow=max_overflow,
+            pool_timeout=pool_timeout,
+            pool_recycle=pool_recycle,
+        )
+    if statement_timeout and url.get_backend_name() == "postgresql":
+        if url.get_driver_name() == "asyncpg":
+            options["connect_args"] = {
+                "server_settings": {"statement_timeout": str(statement_timeout)}
+            }
+        else:
+            options["connect_args"] = {
+                "options": f"-c statement_timeout={statement_timeout}"
+            }
+    return options
+
+
+class EngineMetrics:
+    def __init__(self, engine: Engine, options: Dict[str, Any]) -> None:
+        self._pool = engine.pool
+        self.capacity = 0
+        if options.get("max_overflow", -1) >= 0:
+            self.capacity = options["pool_size"] + options["max_overflow"]
+        self.checkout_seconds = Histogram()
+        self.statement_seconds = Histogram()
+        self.saturation = Histogram(SATURATION_BUCKETS)
+        self.pool_timeouts = 0
+        self.errors = 0
+        event.listen(engine.pool, "checkout", self._on_checkout)
+        event.listen(engine, "before_cursor_execute", self._before_execute)
+        event.listen(engine, "after_cursor_execute", self._after_execute)
+        event.listen(engine, "handle_error", self._on_error)
+
+    def _on_checkout(self, *args: Any) -> None:
+        if self.capacity:
+            self.saturation.observe(self._pool.checkedout() / self.capacity)
+
+    def _before_execute(self, conn: Any, *args: Any) -> None:
+        conn.info.setdefault("statement_started", []).append(time.perf_counter())
+
+    def _after_execute(self, conn: Any, *args: Any) -> None:
+        started = conn.info["statement_started"].pop()
+        self.statement_seconds.observe(time.perf_counter() - started)
+
+    def _on_error(self, context: Any) -> None:
+        self.errors += 1
+        started = (
+            context.connection.info.get("statement_started")
+            if context.connection
+            else None
+        )
+        if started:
+            started.pop()
+
+    def checked_out(self, started: float) -> None:
+        self.checkout_seconds.observe(time.perf_counter() - started)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "capacity": self.capacity,
+            "checked_out": self._pool.checkedout() if self.capacity else None,
+            "pool_timeouts": self.pool_timeouts,
+            "errors": self.errors,
+            "checkout_seconds": self.checkout_seconds.snapshot(),
+            "saturation": self.saturation.snapshot(),
+            "statement_seconds": self.statement_seconds.snapshot(),
+        }
+
 
 class Database:
-    def __init__(self, url: str) -> None:
-        self._engine = create_engine(url, echo=True)
+    def __init__(self, url: Union[str, URL], echo: bool = False, **options: Any) -> None:
+        url = make_url(url)
+        options = engine_options(url, **options)
+        self._engine = create_engine(url, echo=echo, **options)
+        self.metrics = EngineMetrics(self._engine, options)
         self._session_factory = scoped_session(
             sessionmaker(
                 autocommit=False,
@@ -27,11 +122,27 @@ class Database:
 
     def create_database(self) -> None:
         Base.metadata.create_all(self._engine, checkfirst=True)
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                try:
+                    index.create(self._engine, checkfirst=True)
+                except DBAPIError as e:
+                    logger.error(f"Can't create index {index.name}: {e}")
+
+    def raw_connection(self) -> Any:
+        return self._engine.raw_connection()
 
     @contextmanager
-    def session(self) -> Generator[AbstractContextManager[Session], None, None]:
+    def session(self) -> Generator[Session, None, None]:
         session: Session = self._session_factory()
         try:
+            started = time.perf_counter()
+            try:
+                session.connection()
+            except PoolTimeoutError:
+                self.metrics.pool_timeouts += 1
+                raise
+            self.metrics.checked_out(started)
             yield session
         except Exception as e:
             logger.exception(f"Session rollback because of {e}")
@@ -42,5 +153,73 @@ class Database:
 
 
 class PostgreSQL(Database):
-    def __init__(self, dsn: str) -> None:
-        super().__init__(dsn)
+    def __init__(self, dsn: str, **options: Any) -> None:
+        super().__init__(dsn, **options)
+
+
+class AsyncDatabase:
+    DRIVERS = {"postgresql": "postgresql+asyncpg"}
+
+    def __init__(self, url: Union[str, URL], echo: bool = False, **options: Any) -> None:
+        url = make_url(url)
+        url = url.set(drivername=self.DRIVERS.get(url.get_backend_name(), url.drivername))
+        options = engine_options(url, **options)
+        self._engine = create_async_engine(url, echo=echo, **options)
+        self.metrics = EngineMetrics(self._engine.sync_engine, options)
+        self._session_factory = sessionmaker(
+            bind=self._engine,
+            class_=AsyncSession,
+            autoflush=False,
+            expire_on_commit=False,
+        )
+
+    @asynccontextmanager
+    async def session(self) -> AsyncGenerator[AsyncSession, None]:
+        session: AsyncSession = self._session_factory()
+        try:
+            started = time.perf_counter()
+            try:
+                await session.connection()
+            except PoolTimeoutError:
+                self.metrics.pool_timeouts += 1
+                raise
+            self.metrics.checked_out(started)
+            yield session
+        except Exception as e:
+            logger.exception(f"Session rollback because of {e}")
+            await session.rollback()
+            raise
+        finally:
+            await session.close()
+
+    async def close(self) -> None:
+        await self._engine.dispose()
+
+
+class AsyncPostgreSQL(AsyncDatabase):
+    def __init__(self, dsn: str, **options: Any) -> None:
+        super().__init__(dsn, **options)
+
+
+class Redis:
+    def __init__(self, dsn: str, max_connections: int = 50) -> None:
+        self._pool = aioredis.BlockingConnectionPool.from_url(
+            dsn,
+            max_connections=max_connections,
+        )
+        self.connection = aioredis.Redis(connection_pool=self._pool)
+
+    async def close(self) -> None:
+        await self._pool.disconnect()
+
+
+class BlockingRedis:
+    def __init__(self, dsn: str, max_connections: int = 50) -> None:
+        self._pool = redis.BlockingConnectionPool.from_url(
+            dsn,
+            max_connections=max_connections,
+        )
+        self.connection = redis.Redis(connection_pool=self._pool)
+
+    def close(self) -> None:
+        self._pool.disconnect()
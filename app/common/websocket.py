@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+
+from typing import Any
+
+from uvicorn.protocols.websockets.websockets_impl import WebSocketProtocol
+from websockets.extensions.permessage_deflate import ServerPerMessageDeflateFactory
+
+from .conf import WebSocketConfig
+
+cfg = WebSocketConfig()
+
+
+class DeflateWebSocketProtocol(WebSocketProtocol):
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.available_extensions = []
+        if cfg.PER_MESSAGE_DEFLATE:
+            self.available_extensions.append(
+                ServerPerMessageDeflateFactory(
+                    server_max_window_bits=cfg.DEFLATE_WINDOW_BITS,
+                    compress_settings={
+                        "level": cfg.DEFLATE_LEVEL,
+                        "memLevel": cfg.DEFLATE_MEMORY_LEVEL,
+                    },
+                )
+            )
@@ -1,15 +1,21 @@
 # -*- coding: utf-8 -*-
 from __future__ import annotations
 
+import asyncio
+import signal
+from contextlib import suppress
+
 import uvicorn
 from chat.router import router as chat_router
-from common.conf import config
+from common.conf import WebSocketConfig, config
 from common.container import ApplicationContainer
+from common.websocket import DeflateWebSocketProtocol
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from user.router import router as user_router
 
 cfg = config("app")
+ws_cfg = WebSocketConfig()
 
 
 def create_app() -> FastAPI:
@@ -32,10 +38,86 @@ def create_app() -> FastAPI:
         allow_headers=["*"],
     )
 
+    @app.on_event("startup")
+    async def check_payload_codec() -> None:
+        await container.redis.chat_hub().start()
+
+    @app.on_event("startup")
+    async def listen_session_invalidations() -> None:
+        await container.redis.session_cache().start()
+
+    @app.on_event("startup")
+    async def sync_session_denylist() -> None:
+        await container.redis.session_tokens().start()
+
+    @app.on_event("startup")
+    async def join_affinity_ring() -> None:
+        await container.redis.affinity().start()
+
+    @app.on_event("startup")
+    async def drain_on_sigterm() -> None:
+        def drain() -> None:
+            task = container.redis.drainer().drain()
+            task.add_done_callback(lambda _: signal.raise_signal(signal.SIGINT))
+
+        with suppress(NotImplementedError, RuntimeError, ValueError):
+            asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, drain)
+
+    @app.on_event("shutdown")
+    async def leave_affinity_ring() -> None:
+        await container.redis.affinity().close()
+
+    @app.on_event("shutdown")
+    async def stop_session_cache() -> None:
+        await container.redis.session_cache().close()
+
+    @app.on_event("shutdown")
+    async def stop_session_denylist() -> None:
+        await container.redis.session_tokens().close()
+
+    @app.on_event("shutdown")
+    async def stop_heartbeat() -> None:
+        await container.chat.heartbeat().close()
+
+    @app.on_event("shutdown")
+    async def stop_typing_indicator() -> None:
+        await container.redis.typing().close()
+
+    @app.on_event("shutdown")
+    async def stop_presence() -> None:
+        await container.redis.presence().close()
+
+    @app.on_event("shutdown")
+    async def flush_read_cursors() -> None:
+        await container.redis.read_cursors().close()
+
+    @app.on_event("shutdown")
+    async def close_chat_hub() -> None:
+        await container.redis.chat_hub().close()
+
+    @app.on_event("shutdown")
+    async def flush_messages() -> None:
+        await container.service.message_persister().close()
+
+    @app.on_event("shutdown")
+    async def close_session_store() -> None:
+        container.db.redis().close()
+
+    @app.on_event("shutdown")
+    async def close_async_database() -> None:
+        await container.db.async_postgres().close()
+
     return app
 
 
 app = create_app()
 
 if __name__ == "__main__":
-    uvicorn.run("main:app", host="0.0.0.0", reload=True)
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        reload=True,
+        ws=DeflateWebSocketProtocol,
+        ws_ping_interval=ws_cfg.PING_INTERVAL,
+        ws_ping_timeout=ws_cfg.PING_TIMEOUT,
+    )
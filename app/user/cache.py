@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from contextlib import suppress
+from typing import Any, Dict, Optional, Set, Tuple
+
+import orjson
+from common.database import Redis
+
+from .response import User
+
+logger = logging.getLogger(__name__)
+
+
+class SessionCache:
+    CHANNEL = "session:invalidate"
+    RECONNECT_DELAY = 1.0
+
+    def __init__(
+        self,
+        redis: Redis,
+        ttl: float = 30.0,
+        max_size: int = 10000,
+        shared: bool = False,
+        shared_ttl: float = 300.0,
+    ) -> None:
+        self._redis = redis
+        self._ttl = ttl
+        self._max_size = max_size
+        self._shared = shared
+        self._shared_ttl = shared_ttl
+        self._entries: OrderedDict[str, Tuple[float, User]] = OrderedDict()
+        self._sessions: Dict[int, Set[str]] = {}
+        self._listener: Optional[asyncio.Task] = None
+        self.generation = 0
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def key(session_id: str) -> str:
+        return f"session:{session_id}"
+
+    @staticmethod
+    def user_key(user_id: int) -> str:
+        return f"session:user:{user_id}"
+
+    @property
+    def enabled(self) -> bool:
+        return self._ttl > 0 and self._max_size > 0
+
+    async def get(self, session_id: str) -> Optional[User]:
+        entry = self._entries.get(session_id)
+        if entry is not None:
+            expires_at, user = entry
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(session_id)
+                self.hits += 1
+                return user
+            self._drop(session_id)
+        if self._shared:
+            generation = self.generation
+            try:
+                cached = await self._redis.connection.get(self.key(session_id))
+            except Exception as exc:
+                logger.warning(f"Can't read the shared session cache: {exc!r}")
+                cached = None
+            if cached is not None:
+                user = User(**orjson.loads(cached))
+                self.shared_hits += 1
+                self.remember(session_id, user, generation)
+                return user
+        self.misses += 1
+        return None
+
+    def remember(self, session_id: str, user: User, generation: int) -> None:
+        if not self.enabled or generation != self.generation:
+            return
+        self._entries[session_id] = (time.monotonic() + self._ttl, user)
+        self._entries.move_to_end(session_id)
+        self._sessions.setdefault(user.id, set()).add(session_id)
+        while len(self._entries) > self._max_size:
+            self._drop(next(iter(self._entries)))
+
+    async def put(self, session_id: str, user: User, generation: int) -> None:
+        self.remember(session_id, user, generation)
+        if not self._shared or generation != self.generation:
+            return
+        try:
+            async with self._redis.connection.pipeline(transaction=False) as pipe:
+                pipe.set(
+                    self.key(session_id),
+                    orjson.dumps(user.dict()),
+                    ex=int(self._shared_ttl),
+                )
+                pipe.sadd(self.user_key(user.id), session_id)
+                pipe.expire(self.user_key(user.id), int(self._shared_ttl))
+                await pipe.execute()
+        except Exception as exc:
+            logger.warning(f"Can't write the shared session cache: {exc!r}")
+
+    def _drop(self, session_id: str) -> None:
+        entry = self._entries.pop(session_id, None)
+        if entry is None:
+            return
+        sessions = self._sessions.get(entry[1].id)
+        if sessions is not None:
+            sessions.discard(session_id)
+            if not sessions:
+                del self._sessions[entry[1].id]
+
+    def evict_session(self, session_id: str) -> None:
+        self.generation += 1
+        self._drop(session_id)
+
+    def evict_user(self, user_id: int) -> None:
+        self.generation += 1
+        for session_id in list(self._sessions.get(user_id, ())):
+            self._drop(session_id)
+
+    def clear(self) -> None:
+        self.generation += 1
+        self._entries.clear()
+        self._sessions.clear()
+
+    async def invalidate_session(self, session_id: str) -> None:
+        self.evict_session(session_id)
+        try:
+            async with self._redis.connection.pipeline(transaction=False) as pipe:
+                if self._shared:
+                    pipe.delete(self.key(session_id))
+                pipe.publish(self.CHANNEL, f"s:{session_id}")
+                await pipe.execute()
+        except Exception as exc:
+            logger.warning(f"Can't broadcast invalidation of a session: {exc!r}")
+
+    async def invalidate_user(self, user_id: int) -> None:
+        self.evict_user(user_id)
+        connection = self._redis.connection
+        try:
+            session_ids = set()
+            if self._shared:
+                session_ids = await connection.smembers(self.user_key(user_id))
+            async with connection.pipeline(transaction=False) as pipe:
+                for session_id in session_ids:
+                    pipe.delete(self.key(session_id.decode()))
+                if self._shared:
+                    pipe.delete(self.user_key(user_id))
+                pipe.publish(self.CHANNEL, f"u:{user_id}")
+                await pipe.execute()
+        except Exception as exc:
+            logger.warning(f"Can't broadcast invalidation of user {user_id}: {exc!r}")
+
+    async def start(self) -> None:
+        if self.enabled and self._listener is None:
+            self._listener = asyncio.create_task(self._listen())
+
+    async def _listen(self) -> None:
+        while True:
+            pubsub = self._redis.connection.pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.subscribe(self.CHANNEL)
+                self.clear()
+                async for message in pubsub.listen():
+                    self._apply(message["data"].decode())
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                logger.warning(f"Session invalidation listener failed: {exc!r}")
+                await asyncio.sleep(self.RECONNECT_DELAY)
+            finally:
+                with suppress(Exception):
+                    await pubsub.close()
+
+    def _apply(self, invalidation: str) -> None:
+        self.invalidations += 1
+        kind, _, value = invalidation.partition(":")
+        if kind == "s":
+            self.evict_session(value)
+        elif kind == "u":
+            self.evict_user(int(value))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "shared_hits": self.shared_hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+        }
+
+    async def close(self) -> None:
+        if self._listener is not None:
+            self._listener.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._listener
+            self._listener = None
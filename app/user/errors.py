@@ -5,7 +5,7 @@ from common.errors import DatabaseIntegrityError, NotFoundError
 
 
 class UserNotFoundByIdError(NotFoundError):
-    def __init__(self, id: str) -> None:
+    def __init__(self, id: int) -> None:
         super().__init__(f"User(id={id!r}) not found")
 
 
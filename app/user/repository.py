@@ -1,20 +1,66 @@
 # -*- coding: utf-8 -*-
 from __future__ import annotations
 
-from contextlib import AbstractContextManager
-from typing import Callable, Iterator
+from contextlib import AbstractAsyncContextManager, AbstractContextManager
+from typing import Callable, Iterator, List, Optional, Union
+from uuid import uuid4
 
+from common.database import BlockingRedis
+from sqlalchemy import delete, select
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 from user.errors import (
     CannotCreateUserError,
     InvalidUserSessionError,
     NotExistUserError,
+    SessionAlreadyExistError,
     UserNotFoundByEmailError,
     UserNotFoundByIdError,
 )
 from user.models import User, UserSession
 
+CREATE_SESSION = """
+for _, session_id in ipairs(redis.call('SMEMBERS', KEYS[1])) do
+    if redis.call('EXISTS', ARGV[1] .. session_id) == 1 then
+        return 0
+    end
+    redis.call('SREM', KEYS[1], session_id)
+end
+redis.call('SET', ARGV[1] .. ARGV[2], ARGV[3], 'EX', ARGV[4])
+redis.call('SADD', KEYS[1], ARGV[2])
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+return 1
+"""
+
+TOUCH_SESSION = """
+local user_id = redis.call('GET', KEYS[1])
+if user_id then
+    redis.call('EXPIRE', KEYS[1], ARGV[2])
+    redis.call('EXPIRE', ARGV[1] .. user_id, ARGV[2])
+end
+return user_id
+"""
+
+DELETE_SESSION = """
+local user_id = redis.call('GET', KEYS[1])
+if user_id then
+    redis.call('DEL', KEYS[1])
+    redis.call('SREM', ARGV[1] .. user_id, ARGV[2])
+end
+return user_id
+"""
+
+DELETE_SESSIONS = """
+local session_ids = redis.call('SMEMBERS', KEYS[1])
+for _, session_id in ipairs(session_ids) do
+    redis.call('DEL', ARGV[1] .. session_id)
+end
+redis.call('DEL', KEYS[1])
+return #session_ids
+"""
+
 
 class UserRepository:
     def __init__(
@@ -87,6 +133,12 @@ class UserSessionRepository:
     def create(self, user_id: int) -> UserSession:
         try:
             with self.session_factory() as session:
+                if (
+                    session.query(UserSession.id)
+                    .filter(UserSession.user_id == user_id)
+                    .first()
+                ):
+                    raise SessionAlreadyExistError(user_id)
                 new_user_session = UserSession(user_id=user_id)
                 session.add(new_user_session)
                 session.commit()
@@ -113,3 +165,272 @@ class UserSessionRepository:
             for user_session in all_user_sessions:
                 session.delete(user_session)
             session.commit()
+
+
+class RedisUserSessionRepository:
+    SESSION_PREFIX = "user_session:"
+    USER_PREFIX = "user_sessions:"
+
+    def __init__(self, redis: BlockingRedis, ttl: float = 604800.0) -> None:
+        self._redis = redis.connection
+        self._ttl = int(ttl)
+        self._create = self._redis.register_script(CREATE_SESSION)
+        self._touch = self._redis.register_script(TOUCH_SESSION)
+        self._delete = self._redis.register_script(DELETE_SESSION)
+        self._delete_all = self._redis.register_script(DELETE_SESSIONS)
+
+    def _session_key(self, session_id: str) -> str:
+        return f"{self.SESSION_PREFIX}{session_id}"
+
+    def _user_key(self, user_id: int) -> str:
+        return f"{self.USER_PREFIX}{user_id}"
+
+    def get_by_user_id(self, user_id: int) -> Optional[UserSession]:
+        sessions = self.get_all(user_id=user_id)
+        return sessions[0] if sessions else None
+
+    def get_by_session_id(self, session_id: str) -> Optional[UserSession]:
+        user_id = self._touch(
+            keys=[self._session_key(session_id)], args=[self.USER_PREFIX, self._ttl]
+        )
+        if user_id is None:
+            return None
+        return UserSession(session_id=session_id, user_id=int(user_id))
+
+    def get_all(self, user_id: int) -> List[UserSession]:
+        session_ids = sorted(
+            session_id.decode()
+            for session_id in self._redis.smembers(self._user_key(user_id))
+        )
+        with self._redis.pipeline(transaction=False) as pipe:
+            for session_id in session_ids:
+                pipe.exists(self._session_key(session_id))
+            alive = pipe.execute()
+        return [
+            UserSession(session_id=session_id, user_id=user_id)
+            for session_id, exists in zip(session_ids, alive)
+            if exists
+        ]
+
+    def create(self, user_id: int) -> UserSession:
+        session_id = uuid4().hex
+        created = self._create(
+            keys=[self._user_key(user_id)],
+            args=[self.SESSION_PREFIX, session_id, user_id, self._ttl],
+        )
+        if not created:
+            raise SessionAlreadyExistError(user_id)
+        return UserSession(session_id=session_id, user_id=user_id)
+
+    def save(self, user_session: UserSession) -> None:
+        with self._redis.pipeline(transaction=False) as pipe:
+            pipe.set(
+                self._session_key(user_session.session_id),
+                user_session.user_id,
+                ex=self._ttl,
+            )
+            pipe.sadd(self._user_key(user_session.user_id), user_session.session_id)
+            pipe.expire(self._user_key(user_session.user_id), self._ttl)
+            pipe.execute()
+
+    def delete_by_session_id(self, session_id: str) -> None:
+        user_id = self._delete(
+            keys=[self._session_key(session_id)], args=[self.USER_PREFIX, session_id]
+        )
+        if user_id is None:
+            raise InvalidUserSessionError(session_id)
+
+    def delete_all(self, user_id: int) -> None:
+        self._delete_all(keys=[self._user_key(user_id)], args=[self.SESSION_PREFIX])
+
+
+class MigratingUserSessionRepository:
+    def __init__(
+        self,
+        source: UserSessionRepository,
+        target: RedisUserSessionRepository,
+    ) -> None:
+        self._source = source
+        self._target = target
+
+    def get_by_user_id(self, user_id: int) -> Optional[UserSession]:
+        return self._target.get_by_user_id(user_id=user_id) or self._migrate(
+            self._source.get_by_user_id(user_id=user_id)
+        )
+
+    def get_by_session_id(self, session_id: str) -> Optional[UserSession]:
+        return self._target.get_by_session_id(session_id=session_id) or self._migrate(
+            self._source.get_by_session_id(session_id=session_id)
+        )
+
+    def _migrate(self, user_session: Optional[UserSession]) -> Optional[UserSession]:
+        if user_session is not None:
+            self._target.save(user_session)
+        return user_session
+
+    def get_all(self, user_id: int) -> List[UserSession]:
+        sessions = {
+            user_session.session_id: user_session
+            for user_session in self._source.get_all(user_id=user_id)
+        }
+        for user_session in self._target.get_all(user_id=user_id):
+            sessions[user_session.session_id] = user_session
+        return list(sessions.values())
+
+    def create(self, user_id: int) -> UserSession:
+        if self._source.get_by_user_id(user_id=user_id):
+            raise SessionAlreadyExistError(user_id)
+        return self._target.create(user_id=user_id)
+
+    def delete_by_session_id(self, session_id: str) -> None:
+        deleted = False
+        try:
+            self._target.delete_by_session_id(session_id=session_id)
+            deleted = True
+        except InvalidUserSessionError:
+            pass
+        try:
+            self._source.delete_by_session_id(session_id=session_id)
+            deleted = True
+        except InvalidUserSessionError:
+            pass
+        if not deleted:
+            raise InvalidUserSessionError(session_id)
+
+    def delete_all(self, user_id: int) -> None:
+        self._target.delete_all(user_id=user_id)
+        self._source.delete_all(user_id=user_id)
+
+
+class AsyncUserRepository:
+    def __init__(
+        self, session_factory: Callable[..., AbstractAsyncContextManager[AsyncSession]]
+    ) -> None:
+        self.session_factory = session_factory
+
+    async def get_all(self) -> List[User]:
+        async with self.session_factory() as session:
+            return (await session.execute(select(User))).scalars().all()
+
+    async def get(self, id: int) -> User:
+        async with self.session_factory() as session:
+            user = await session.get(User, id)
+            if not user:
+                raise UserNotFoundByIdError(id)
+            return user
+
+    async def get_by_email(self, email: str) -> User:
+        async with self.session_factory() as session:
+            users = await session.execute(select(User).where(User.email == email))
+            user = users.scalars().first()
+            if not user:
+                raise UserNotFoundByEmailError(email)
+            return user
+
+    async def create(self, name: str, email: str, password: str) -> User:
+        try:
+            async with self.session_factory() as session:
+                user = User(name=name, email=email, password=password)
+                session.add(user)
+                await session.commit()
+                await session.refresh(user)
+                return user
+        except IntegrityError:
+            raise CannotCreateUserError(name=name, email=email)
+
+    async def delete(self, id: int) -> None:
+        async with self.session_factory() as session:
+            user = await session.get(User, id)
+            if not user:
+                raise UserNotFoundByIdError(id)
+            await session.delete(user)
+            await session.commit()
+
+
+class AsyncUserSessionRepository:
+    def __init__(
+        self, session_factory: Callable[..., AbstractAsyncContextManager[AsyncSession]]
+    ) -> None:
+        self.session_factory = session_factory
+
+    async def get_by_user_id(self, user_id: int) -> Optional[UserSession]:
+        async with self.session_factory() as session:
+            user_sessions = await session.execute(
+                select(UserSession).where(UserSession.user_id == user_id)
+            )
+            return user_sessions.scalars().first()
+
+    async def get_by_session_id(self, session_id: str) -> Optional[UserSession]:
+        async with self.session_factory() as session:
+            user_sessions = await session.execute(
+                select(UserSession).where(UserSession.session_id == session_id)
+            )
+            return user_sessions.scalars().first()
+
+    async def get_all(self, user_id: int) -> List[UserSession]:
+        async with self.session_factory() as session:
+            user_sessions = await session.execute(
+                select(UserSession).where(UserSession.user_id == user_id)
+            )
+            return user_sessions.scalars().all()
+
+    async def create(self, user_id: int) -> UserSession:
+        try:
+            async with self.session_factory() as session:
+                if await session.scalar(
+                    select(UserSession.id).where(UserSession.user_id == user_id).limit(1)
+                ):
+                    raise SessionAlreadyExistError(user_id)
+                new_user_session = UserSession(user_id=user_id)
+                session.add(new_user_session)
+                await session.commit()
+                await session.refresh(new_user_session)
+                return new_user_session
+        except IntegrityError:
+            raise NotExistUserError(user_id)
+
+    async def delete_by_session_id(self, session_id: str) -> None:
+        async with self.session_factory() as session:
+            deleted = await session.execute(
+                delete(UserSession).where(UserSession.session_id == session_id)
+            )
+            if not deleted.rowcount:
+                raise InvalidUserSessionError(session_id)
+            await session.commit()
+
+    async def delete_all(self, user_id: int) -> None:
+        async with self.session_factory() as session:
+            await session.execute(
+                delete(UserSession).where(UserSession.user_id == user_id)
+            )
+            await session.commit()
+
+
+class ThreadedUserSessionRepository:
+    def __init__(
+        self,
+        repository: Union[RedisUserSessionRepository, MigratingUserSessionRepository],
+    ) -> None:
+        self._repository = repository
+
+    async def get_by_user_id(self, user_id: int) -> Optional[UserSession]:
+        return await run_in_threadpool(self._repository.get_by_user_id, user_id=user_id)
+
+    async def get_by_session_id(self, session_id: str) -> Optional[UserSession]:
+        return await run_in_threadpool(
+            self._repository.get_by_session_id, session_id=session_id
+        )
+
+    async def get_all(self, user_id: int) -> List[UserSession]:
+        return await run_in_threadpool(self._repository.get_all, user_id=user_id)
+
+    async def create(self, user_id: int) -> UserSession:
+        return await run_in_threadpool(self._repository.create, user_id=user_id)
+
+    async def delete_by_session_id(self, session_id: str) -> None:
+        return await run_in_threadpool(
+            self._repository.delete_by_session_id, session_id=session_id
+        )
+
+    async def delete_all(self, user_id: int) -> None:
+        return await run_in_threadpool(self._repository.delete_all, user_id=user_id)
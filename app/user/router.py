@@ -7,9 +7,16 @@ from fastapi import APIRouter, Depends, Header, Response, status
 from fastapi.encoders import jsonable_encoder
 from fastapi.responses import JSONResponse
 
+from .cache import SessionCache
 from .request import CreateUser, LoginUser
 from .response import AllUsers, CreatedUserSession, User
-from .service import UserService, UserSessionService
+from .service import (
+    AsyncUserService,
+    AsyncUserSessionService,
+    UserService,
+    UserSessionService,
+)
+from .token import SessionTokens
 
 from common.container import ApplicationContainer  # isort:skip
 from common.response import ErrorResponse  # isort:skip
@@ -77,14 +84,22 @@ def create_user(
 
 @router.delete("/users/{id}", tags=[USER_TAGS])
 @inject
-def delete_user_by_id(
+async def delete_user_by_id(
     id: int,
     x_session_id: str = Header(...),
-    user_service: UserService = Depends(Provide[ApplicationContainer.service.user]),
+    user_service: AsyncUserService = Depends(
+        Provide[ApplicationContainer.service.async_user]
+    ),
+    session_cache: SessionCache = Depends(
+        Provide[ApplicationContainer.redis.session_cache]
+    ),
+    session_tokens: SessionTokens = Depends(
+        Provide[ApplicationContainer.redis.session_tokens]
+    ),
     current_uesr: User = Depends(Session.verify),
 ) -> Union[JSONResponse, Response]:
     try:
-        user_service.delete_by_id(id=id)
+        await user_service.delete_by_id(id=id)
     except Exception as exception:
         error = ErrorResponse(
             error_message="Can't delete user",
@@ -93,6 +108,8 @@ def delete_user_by_id(
         return JSONResponse(
             jsonable_encoder(error), status_code=status.HTTP_404_NOT_FOUND
         )
+    await session_cache.invalidate_user(id)
+    await session_tokens.revoke_user(id)
     return Response(status_code=status.HTTP_204_NO_CONTENT)
 
 
@@ -104,6 +121,9 @@ def create_session(
         Provide[ApplicationContainer.service.user_session]
     ),
     user_service: UserService = Depends(Provide[ApplicationContainer.service.user]),
+    session_tokens: SessionTokens = Depends(
+        Provide[ApplicationContainer.redis.session_tokens]
+    ),
 ) -> JSONResponse:
     try:
         user = user_service.get_by_email(email=account.email)
@@ -114,7 +134,12 @@ def create_session(
             return JSONResponse(
                 jsonable_encoder(error), status_code=status.HTTP_404_NOT_FOUND
             )
-        new_session = user_session.create(user_id=user.id)
+        if session_tokens.enabled:
+            new_session = CreatedUserSession(
+                session_id=session_tokens.issue(user), user_id=user.id
+            )
+        else:
+            new_session = user_session.create(user_id=user.id)
     except Exception as exception:
         error = ErrorResponse(
             error_message="Can't create session",
@@ -130,15 +155,24 @@ def create_session(
 
 @router.delete("/sessions", tags=[USER_SESSION_TAGS])
 @inject
-def delete_session_by_session_id(
+async def delete_session_by_session_id(
     x_session_id: str = Header(...),
-    user_session: UserSessionService = Depends(
-        Provide[ApplicationContainer.service.user_session]
+    user_session: AsyncUserSessionService = Depends(
+        Provide[ApplicationContainer.service.async_user_session]
+    ),
+    session_cache: SessionCache = Depends(
+        Provide[ApplicationContainer.redis.session_cache]
+    ),
+    session_tokens: SessionTokens = Depends(
+        Provide[ApplicationContainer.redis.session_tokens]
     ),
     current_uesr: User = Depends(Session.verify),
 ) -> Union[Response, JSONResponse]:
+    if session_tokens.owns(x_session_id):
+        await session_tokens.revoke(x_session_id)
+        return Response(status_code=status.HTTP_204_NO_CONTENT)
     try:
-        user_session.delete_by_session_id(session_id=x_session_id)
+        await user_session.delete_by_session_id(session_id=x_session_id)
     except Exception as exception:
         error = ErrorResponse(
             error_message="Can't delete session",
@@ -147,4 +181,29 @@ def delete_session_by_session_id(
         return JSONResponse(
             jsonable_encoder(error), status_code=status.HTTP_400_BAD_REQUEST
         )
+    await session_cache.invalidate_session(x_session_id)
     return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+
+@router.get("/sessions/cache/stats", tags=[USER_SESSION_TAGS])
+@inject
+async def get_session_cache_stats(
+    x_session_id: str = Header(...),
+    session_cache: SessionCache = Depends(
+        Provide[ApplicationContainer.redis.session_cache]
+    ),
+    current_uesr: User = Depends(Session.verify),
+) -> JSONResponse:
+    return JSONResponse(session_cache.stats(), status_code=status.HTTP_200_OK)
+
+
+@router.get("/sessions/tokens/stats", tags=[USER_SESSION_TAGS])
+@inject
+async def get_session_token_stats(
+    x_session_id: str = Header(...),
+    session_tokens: SessionTokens = Depends(
+        Provide[ApplicationContainer.redis.session_tokens]
+    ),
+    current_uesr: User = Depends(Session.verify),
+) -> JSONResponse:
+    return JSONResponse(session_tokens.stats(), status_code=status.HTTP_200_OK)
@@ -1,15 +1,17 @@
 # -*- coding: utf-8 -*-
 from __future__ import annotations
 
-from typing import Iterator
+from typing import Iterator, List, Optional, Union
 
-from .errors import (
-    InvalidUserSessionError,
-    SessionAlreadyExistError,
-    UserNotLoggedInError,
-)
+from .errors import InvalidUserSessionError, UserNotLoggedInError
 from .models import User, UserSession
-from .repository import UserRepository, UserSessionRepository
+from .repository import (
+    AsyncUserRepository,
+    AsyncUserSessionRepository,
+    ThreadedUserSessionRepository,
+    UserRepository,
+    UserSessionRepository,
+)
 
 
 class UserService:
@@ -43,9 +45,6 @@ class UserSessionService:
         return self._repository.get_by_session_id(session_id=session_id)
 
     def create(self, user_id: int) -> UserSession:
-        is_exist = self._repository.get_by_user_id(user_id=user_id)
-        if is_exist:
-            raise SessionAlreadyExistError(user_id)
         return self._repository.create(user_id=user_id)
 
     def delete_by_session_id(self, session_id: str) -> None:
@@ -59,3 +58,51 @@ class UserSessionService:
         if not is_exist:
             raise UserNotLoggedInError(user_id=user_id)
         return self._repository.delete_all(user_id=user_id)
+
+
+class AsyncUserService:
+    def __init__(self, user_repository: AsyncUserRepository) -> None:
+        self._repository = user_repository
+
+    async def get_all(self) -> List[User]:
+        return await self._repository.get_all()
+
+    async def get_by_id(self, id: int) -> User:
+        return await self._repository.get(id=id)
+
+    async def get_by_email(self, email: str) -> User:
+        return await self._repository.get_by_email(email)
+
+    async def create(self, name: str, email: str, password: str) -> User:
+        return await self._repository.create(name=name, email=email, password=password)
+
+    async def delete_by_id(self, id: int) -> None:
+        return await self._repository.delete(id=id)
+
+
+class AsyncUserSessionService:
+    def __init__(
+        self,
+        user_session_repository: Union[
+            AsyncUserSessionRepository, ThreadedUserSessionRepository
+        ],
+    ):
+        self._repository = user_session_repository
+
+    async def get_by_user_id(self, user_id: int) -> Optional[UserSession]:
+        return await self._repository.get_by_user_id(user_id=user_id)
+
+    async def get_by_session_id(self, session_id: str) -> Optional[UserSession]:
+        return await self._repository.get_by_session_id(session_id=session_id)
+
+    async def create(self, user_id: int) -> UserSession:
+        return await self._repository.create(user_id=user_id)
+
+    async def delete_by_session_id(self, session_id: str) -> None:
+        return await self._repository.delete_by_session_id(session_id=session_id)
+
+    async def delete_all(self, user_id: int) -> None:
+        is_exist = await self._repository.get_all(user_id=user_id)
+        if not is_exist:
+            raise UserNotLoggedInError(user_id=user_id)
+        return await self._repository.delete_all(user_id=user_id)
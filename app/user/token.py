@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+
+import asyncio
+import base64
+import hashlib
+import hmac
+import logging
+import secrets
+import time
+from contextlib import suppress
+from typing import Any, Dict, List, Optional, Set
+
+import orjson
+from common.bloom import BloomFilter
+from common.database import Redis
+
+from .response import User
+
+logger = logging.getLogger(__name__)
+
+
+def _b64encode(data: bytes) -> bytes:
+    return base64.urlsafe_b64encode(data).rstrip(b"=")
+
+
+def _b64decode(data: bytes) -> bytes:
+    return base64.urlsafe_b64decode(data + b"=" * (-len(data) % 4))
+
+
+class SessionTokens:
+    PREFIX = "v1."
+    DENYLIST_KEY = "session:denylist"
+    CHANNEL = "session:revoke"
+    RECONNECT_DELAY = 1.0
+
+    def __init__(
+        self,
+        redis: Redis,
+        enabled: bool = False,
+        secret: str = "",
+        ttl: float = 3600.0,
+        denylist_capacity: int = 100000,
+        denylist_error_rate: float = 0.001,
+        refresh_interval: float = 60.0,
+    ) -> None:
+        if enabled and not secret:
+            raise ValueError("Session tokens need a secret")
+        self._redis = redis
+        self.enabled = enabled
+        self._ttl = ttl
+        self._capacity = denylist_capacity
+        self._error_rate = denylist_error_rate
+        self._refresh_interval = refresh_interval
+        self._mac = hmac.new(secret.encode(), digestmod=hashlib.sha256)
+        self._denylist = BloomFilter(denylist_capacity, denylist_error_rate)
+        self._revoked_users: Set[int] = set()
+        self._cleared: Set[str] = set()
+        self._pending: Dict[str, float] = {}
+        self._syncer: Optional[asyncio.Task] = None
+        self.rejected = 0
+        self.false_positives = 0
+
+    def owns(self, token: str) -> bool:
+        return self.enabled and token.startswith(self.PREFIX)
+
+    def _sign(self, payload: bytes) -> bytes:
+        mac = self._mac.copy()
+        mac.update(payload)
+        return _b64encode(mac.digest()[:16])
+
+    def issue(self, user: Any) -> str:
+        claims = [user.id, user.name, user.email, int(time.time() + self._ttl)]
+        claims.append(secrets.token_urlsafe(9))
+        payload = _b64encode(orjson.dumps(claims))
+        return f"{self.PREFIX}{payload.decode()}.{self._sign(payload).decode()}"
+
+    def decode(self, token: str) -> Optional[List[Any]]:
+        payload, _, signature = token.encode()[len(self.PREFIX) :].partition(b".")
+        if not hmac.compare_digest(self._sign(payload), signature):
+            return None
+        claims = orjson.loads(_b64decode(payload))
+        if claims[3] < time.time():
+            return None
+        return claims
+
+    def denied(self, claims: List[Any]) -> bool:
+        return claims[0] in self._revoked_users or (
+            claims[4] in self._denylist and claims[4] not in self._cleared
+        )
+
+    async def verify(self, token: str) -> Optional[User]:
+        try:
+            claims = self.decode(token)
+        except Exception:
+            claims = None
+        if claims is None or (self.denied(claims) and await self._revoked(claims)):
+            self.rejected += 1
+            return None
+        return User.construct(id=claims[0], name=claims[1], email=claims[2])
+
+    async def _revoked(self, claims: List[Any]) -> bool:
+        if claims[0] in self._revoked_users:
+            return True
+        try:
+            score = await self._redis.connection.zscore(
+                self.DENYLIST_KEY, f"t:{claims[4]}"
+            )
+        except Exception as exc:
+            logger.warning(f"Can't check the session denylist: {exc!r}")
+            return True
+        if score is not None:
+            return True
+        self.false_positives += 1
+        if len(self._cleared) >= self._capacity:
+            self._cleared.clear()
+        self._cleared.add(claims[4])
+        return False
+
+    def _add(self, member: str) -> None:
+        kind, _, value = member.partition(":")
+        if kind == "u":
+            self._revoked_users.add(int(value))
+        else:
+            self._denylist.add(value)
+            self._cleared.discard(value)
+
+    async def revoke(self, token: str) -> None:
+        claims = self.decode(token)
+        if claims is not None:
+            await self._deny(f"t:{claims[4]}", claims[3])
+
+    async def revoke_user(self, user_id: int) -> None:
+        if self.enabled:
+            await self._deny(f"u:{user_id}", time.time() + self._ttl)
+
+    async def _deny(self, member: str, expires: float) -> None:
+        self._add(member)
+        self._pending[member] = expires
+        try:
+            await self._publish_pending()
+        except Exception as exc:
+            logger.warning(f"Can't publish revocation {member!r}, will retry: {exc!r}")
+
+    async def _publish_pending(self) -> None:
+        pending = dict(self._pending)
+        if not pending:
+            return
+        async with self._redis.connection.pipeline(transaction=False) as pipe:
+            pipe.zadd(self.DENYLIST_KEY, pending)
+            for member in pending:
+                pipe.publish(self.CHANNEL, member)
+            await pipe.execute()
+        for member in pending:
+            self._pending.pop(member, None)
+
+    async def refresh(self) -> None:
+        await self._publish_pending()
+        now = time.time()
+        async with self._redis.connection.pipeline(transaction=False) as pipe:
+            pipe.zremrangebyscore(self.DENYLIST_KEY, "-inf", now)
+            pipe.zrangebyscore(self.DENYLIST_KEY, now, "+inf")
+            _, members = await pipe.execute()
+        denylist = BloomFilter(max(self._capacity, len(members) * 2), self._error_rate)
+        revoked_users = set()
+        for member in members:
+            kind, _, value = member.decode().partition(":")
+            if kind == "u":
+                revoked_users.add(int(value))
+            else:
+                denylist.add(value)
+        self._denylist, self._revoked_users = denylist, revoked_users
+        self._cleared.clear()
+
+    async def start(self) -> None:
+        if self.enabled and self._syncer is None:
+            self._syncer = asyncio.create_task(self._sync())
+
+    async def _sync(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            pubsub = self._redis.connection.pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.subscribe(self.CHANNEL)
+                await self.refresh()
+                refresh_at = loop.time() + self._refresh_interval
+                while True:
+                    message = await pubsub.get_message(
+                        ignore_subscribe_messages=True,
+                        timeout=max(0.0, refresh_at - loop.time()),
+                    )
+                    if message is not None:
+                        self._add(message["data"].decode())
+                    if loop.time() >= refresh_at:
+                        await self.refresh()
+                        refresh_at = loop.time() + self._refresh_interval
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                logger.warning(f"Session denylist sync failed: {exc!r}")
+                await asyncio.sleep(self.RECONNECT_DELAY)
+            finally:
+                with suppress(Exception):
+                    await pubsub.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "denylist": self._denylist.count,
+            "revoked_users": len(self._revoked_users),
+            "rejected": self.rejected,
+            "false_positives": self.false_positives,
+            "pending_revocations": len(self._pending),
+        }
+
+    async def close(self) -> None:
+        if self._syncer is not None:
+            self._syncer.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._syncer
+            self._syncer = None
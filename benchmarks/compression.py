@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+# Bytes and CPU per chat message for the Redis payload codecs and permessage-deflate.
+#
+#   PYTHONPATH=app python benchmarks/compression.py --redis redis://localhost:6379
+#   PYTHONPATH=app python benchmarks/compression.py --workload recorded.jsonl
+#
+# --redis replays the frames recorded in the chat:*:log streams of a running deployment
+# (pass --dictionary if it writes dictionary-compressed payloads), --workload reads JSON
+# lines of recorded messages. Only without either is a synthetic room conversation
+# generated, which is a stand-in and flatters the trained dictionary. The dictionary is
+# trained on the first half of the workload and measured on the second half.
+from __future__ import annotations
+
+import argparse
+import random
+import time
+import zlib
+from typing import Callable, List, Tuple
+from uuid import uuid4
+
+import orjson
+import redis
+from chat.compression import DictionaryCodec, load_codec, train_dictionary
+from chat.const import MessageType
+from chat.frame import Frame
+from chat.message import SystemMessage, UserMessage
+from user.response import User
+
+PHRASES = [
+    "안녕하세요",
+    "오늘 회의는 3시에 시작합니다",
+    "네 확인했습니다",
+    "좋아요!",
+    "점심 뭐 먹을까요?",
+    "let's ship it",
+    "PR 리뷰 부탁드려요",
+    "ok",
+    "배포 끝났습니다",
+    "ㅋㅋㅋㅋ",
+]
+
+
+def synthetic_workload(count: int, seed: int = 7) -> List[bytes]:
+    rng = random.Random(seed)
+    users = [
+        User(id=i, email=f"user{i}@example.com", name=f"user{i}") for i in range(1, 51)
+    ]
+    timestamp = 1_670_000_000.0
+    workload = []
+    for _ in range(count):
+        timestamp += rng.expovariate(1 / 3)
+        extra = {"id": str(uuid4()), "timestamp": timestamp}
+        if rng.random() < 0.05:
+            user = rng.choice(users)
+            message = SystemMessage(
+                text=f"{user.name!r}님이 입장하셨습니다.",
+                type=MessageType.NOTIFICATION,
+                **extra,
+            )
+        else:
+            text = " ".join(rng.choice(PHRASES) for _ in range(rng.randint(1, 3)))
+            message = UserMessage(
+                text=text, type=MessageType.SEND, sender=rng.choice(users), **extra
+            )
+        workload.append(Frame.from_message(message).data)
+    return workload
+
+
+def recorded_workload(url: str, dictionary_path: str, count: int) -> List[bytes]:
+    codec = load_codec(dictionary_path)
+    client = redis.Redis.from_url(url)
+    workload: List[bytes] = []
+    for key in client.scan_iter(match="chat:*:log", _type="stream"):
+        for _, fields in client.xrange(key, count=count - len(workload)):
+            workload.append(codec.decode(fields[b"p"]))
+        if len(workload) >= count:
+            break
+    return workload
+
+
+def per_message(level: int) -> Tuple[Callable, Callable]:
+    return (lambda data: zlib.compress(data, level)), zlib.decompress
+
+
+def dictionary(codec: DictionaryCodec) -> Tuple[Callable, Callable]:
+    return codec.encode, codec.decode
+
+
+def permessage_deflate(window_bits: int, memory_level: int, level: int) -> Tuple:
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -window_bits, memory_level)
+    decompressor = zlib.decompressobj(-window_bits)
+
+    def encode(data: bytes) -> bytes:
+        return (compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH))[:-4]
+
+    def decode(data: bytes) -> bytes:
+        return decompressor.decompress(data + b"\x00\x00\xff\xff")
+
+    return encode, decode
+
+
+def measure(name: str, codec: Tuple[Callable, Callable], messages: List[bytes]) -> None:
+    encode, decode = codec
+    size, cpu = 0, 0.0
+    for data in messages:
+        started = time.process_time()
+        payload = encode(data)
+        assert decode(payload) == data
+        cpu += time.process_time() - started
+        size += len(payload)
+    print(
+        f"{name:>28}: {size / len(messages):7.1f} B/msg, "
+        f"{cpu / len(messages) * 1e6:6.2f} us CPU/msg (encode+decode)"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--redis", help="Redis URL to read recorded room logs from")
+    parser.add_argument("--dictionary", help="REDIS_PAYLOAD_DICTIONARY of that Redis")
+    parser.add_argument("--workload", help="JSON lines of recorded chat messages")
+    parser.add_argument("-n", "--count", type=int, default=20000)
+    parser.add_argument("--dictionary-size", type=int, default=4096)
+    args = parser.parse_args()
+
+    if args.redis:
+        workload = recorded_workload(args.redis, args.dictionary, args.count)
+    elif args.workload:
+        with open(args.workload, "rb") as recorded:
+            workload = [
+                orjson.dumps(orjson.loads(line)) for line in recorded if line.strip()
+            ]
+    else:
+        workload = synthetic_workload(args.count)
+    training, messages = workload[: len(workload) // 2], workload[len(workload) // 2 :]
+    codec = DictionaryCodec(train_dictionary(training, size=args.dictionary_size))
+
+    measure("raw json", ((lambda data: data), (lambda data: data)), messages)
+    measure("zlib per message", per_message(6), messages)
+    measure("zlib + trained dictionary", dictionary(codec), messages)
+    measure("permessage-deflate 15/8", permessage_deflate(15, 8, 6), messages)
+    measure("permessage-deflate 12/5", permessage_deflate(12, 5, 6), messages)
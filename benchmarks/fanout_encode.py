@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+# Per-recipient serialization cost of a room broadcast, encode-per-recipient vs. Frame.
+#
+#   PYTHONPATH=app python benchmarks/fanout_encode.py
+from __future__ import annotations
+
+import argparse
+import json
+import timeit
+from typing import List
+
+from chat.const import MessageType
+from chat.frame import Frame
+from chat.message import UserMessage
+from fastapi.encoders import jsonable_encoder
+from user.response import User
+
+MESSAGE = UserMessage(
+    text="안녕하세요, 오늘 회의는 3시에 시작합니다.",
+    type=MessageType.SEND,
+    sender=User(id=42, email="someone@example.com", name="someone"),
+)
+
+
+def per_recipient(recipients: int) -> List[str]:
+    return [json.dumps(jsonable_encoder(MESSAGE)) for _ in range(recipients)]
+
+
+def serialize_once(recipients: int) -> List[str]:
+    frame = Frame.from_message(MESSAGE)
+    return [frame.text for _ in range(recipients)]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-r", "--recipients", type=int, nargs="*", default=[10, 100, 1000]
+    )
+    parser.add_argument("-n", "--number", type=int, default=50)
+    args = parser.parse_args()
+
+    for recipients in args.recipients:
+        for runner in (per_recipient, serialize_once):
+            elapsed = min(
+                timeit.repeat(lambda: runner(recipients), number=args.number, repeat=5)
+            )
+            cost = elapsed / args.number / recipients * 1e6
+            print(f"{runner.__name__:>14} x{recipients:<5}: {cost:8.3f} us/recipient")
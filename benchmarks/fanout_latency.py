@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+# Delivery latency of a room broadcast by room size, awaiting each write vs. ChatHub.
+#
+#   PYTHONPATH=app python benchmarks/fanout_latency.py -r 10 100 1000 --slow 0.01
+#
+# Every recipient is a SocketHandler over an in-memory websocket whose writes take
+# --write-latency; a --slow fraction of them never finish a write. "awaited" writes to
+# each socket in turn as ChatRoomService.broadcast used to, "hub" hands the frame to
+# ChatHub, which only enqueues it on each socket's outbox. Latency is measured from the
+# start of the broadcast to the moment each recipient's write completes. No Redis
+# connection is opened.
+from __future__ import annotations
+
+import argparse
+import asyncio
+import random
+import time
+from typing import Any, Dict, List, Optional
+
+from chat.const import MessageType
+from chat.frame import Frame
+from chat.message import UserMessage
+from chat.pubsub import ChatHub
+from chat.socket_handler import SocketHandler
+from common.database import Redis
+from user.response import User
+
+MESSAGE = UserMessage(
+    text="안녕하세요, 오늘 회의는 3시에 시작합니다.",
+    type=MessageType.SEND,
+    sender=User(id=42, email="someone@example.com", name="someone"),
+)
+
+
+class MemorySocket:
+    def __init__(self, latencies: List[float], write_latency: float, stalled: bool):
+        self.scope: Dict[str, Any] = {}
+        self.started = 0.0
+        self._latencies = latencies
+        self._write_latency = write_latency
+        self._stalled = stalled
+
+    async def accept(self, subprotocol: Optional[str] = None) -> None:
+        pass
+
+    async def send_text(self, text: str) -> None:
+        if self._stalled:
+            await asyncio.Event().wait()
+        await asyncio.sleep(self._write_latency)
+        self._latencies.append(time.perf_counter() - self.started)
+
+    async def close(self, code: int = 1000, reason: Optional[str] = None) -> None:
+        pass
+
+
+def percentile(samples: List[float], fraction: float) -> float:
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+
+async def measure(name: str, recipients: int, args: argparse.Namespace) -> None:
+    latencies: List[float] = []
+    rng = random.Random(recipients)
+    sockets = [
+        MemorySocket(latencies, args.write_latency, rng.random() < args.slow)
+        for _ in range(recipients)
+    ]
+    handlers = [
+        SocketHandler(
+            socket,
+            User(id=i, email=f"user{i}@example.com", name=f"user{i}"),
+            send_timeout=args.send_timeout,
+        )
+        for i, socket in enumerate(sockets)
+    ]
+    for handler in handlers:
+        await handler.connect()
+    hub = ChatHub(Redis("redis://localhost:6379"))
+    hub.channels["chat:1"] = set(handlers)
+    data = Frame.from_message(MESSAGE).data
+    healthy = sum(not socket._stalled for socket in sockets)
+
+    for _ in range(args.messages):
+        started = time.perf_counter()
+        for socket in sockets:
+            socket.started = started
+        expected = len(latencies) + healthy
+        if name == "awaited":
+            for socket in sockets:
+                try:
+                    await asyncio.wait_for(socket.send_text(data), args.send_timeout)
+                except asyncio.TimeoutError:
+                    pass
+        else:
+            await hub._dispatch("chat:1", data)
+        while len(latencies) < expected:
+            await asyncio.sleep(0.001)
+
+    for handler in handlers:
+        handler.abort()
+    latencies.sort()
+    print(
+        f"{name:>8} x{recipients:<5}: "
+        f"delivery p50 {percentile(latencies, 0.5) * 1e3:8.2f} ms, "
+        f"p99 {percentile(latencies, 0.99) * 1e3:8.2f} ms, "
+        f"max {latencies[-1] * 1e3:8.2f} ms"
+    )
+
+
+async def main(args: argparse.Namespace) -> None:
+    for recipients in args.recipients:
+        for name in args.only or ("awaited", "hub"):
+            await measure(name, recipients, args)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-r", "--recipients", type=int, nargs="*", default=[10, 100, 1000]
+    )
+    parser.add_argument("-m", "--messages", type=int, default=20)
+    parser.add_argument("--write-latency", type=float, default=0.0005)
+    parser.add_argument("--slow", type=float, default=0.0)
+    parser.add_argument("--send-timeout", type=float, default=0.1)
+    parser.add_argument("--only", nargs="*", choices=("awaited", "hub"))
+    asyncio.run(main(parser.parse_args()))
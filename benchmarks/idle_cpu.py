@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+# CPU cost of idle websocket subscribers, per-connection polling vs. ChatHub.
+#
+#   PYTHONPATH=app python benchmarks/idle_cpu.py --dsn redis://localhost:6379 -n 200
+from __future__ import annotations
+
+import argparse
+import asyncio
+import time
+from typing import List
+
+import aioredis
+from chat.pubsub import ChatHub
+from common.database import Redis
+
+
+class IdleSocket:
+    user_name = "idle"
+
+    async def send(self, data: str) -> None:
+        pass
+
+
+async def polling(dsn: str, connections: int, seconds: float) -> None:
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + seconds
+
+    async def subscriber(room_id: int) -> None:
+        connection = await aioredis.from_url(dsn, encoding="utf-8", decode_responses=True)
+        pubsub = connection.pubsub()
+        await pubsub.subscribe(f"chat:{room_id}")
+        while loop.time() < deadline:
+            await pubsub.get_message(ignore_subscribe_messages=True)
+        await pubsub.close()
+        await connection.close()
+
+    await asyncio.gather(*(subscriber(room_id) for room_id in range(connections)))
+
+
+async def hub(dsn: str, connections: int, seconds: float) -> None:
+    chat_hub = ChatHub(Redis(dsn, max_connections=8))
+    sockets: List[IdleSocket] = [IdleSocket() for _ in range(connections)]
+    for room_id, socket in enumerate(sockets):
+        await chat_hub.subscribe(f"chat:{room_id}", socket)
+    await asyncio.sleep(seconds)
+    await chat_hub.close()
+
+
+def measure(name: str, dsn: str, connections: int, seconds: float) -> None:
+    runner = polling if name == "polling" else hub
+    started = time.process_time()
+    asyncio.run(runner(dsn, connections, seconds))
+    used = time.process_time() - started
+    print(
+        f"{name:>8}: {used:.3f}s CPU over {seconds:.0f}s, "
+        f"{used / seconds / connections * 1e3:.4f} ms CPU/s per idle connection"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dsn", default="redis://localhost:6379")
+    parser.add_argument("-n", "--connections", type=int, default=100)
+    parser.add_argument("-s", "--seconds", type=float, default=10.0)
+    parser.add_argument("--only", nargs="*", choices=("polling", "hub"))
+    args = parser.parse_args()
+
+    for name in args.only or ("polling", "hub"):
+        measure(name, args.dsn, args.connections, args.seconds)
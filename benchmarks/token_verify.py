@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+# CPU cost of verifying a signed session token against a populated denylist.
+#
+#   PYTHONPATH=app python benchmarks/token_verify.py -n 200000 --revoked 100000
+#
+# Runs SessionTokens.verify on the event loop the way Session.verify does. Tokens are
+# never revoked, so a Redis round trip only happens on a Bloom filter false positive.
+from __future__ import annotations
+
+import argparse
+import asyncio
+import secrets
+import time
+
+from common.database import Redis
+from user.response import User
+from user.token import SessionTokens
+
+
+async def measure(tokens: SessionTokens, count: int, users: int) -> None:
+    issued = [
+        tokens.issue(User(id=i, name=f"user{i}", email=f"user{i}@bench"))
+        for i in range(users)
+    ]
+    for token in issued[: min(users, 1000)]:
+        assert await tokens.verify(token) is not None
+    started = time.perf_counter()
+    for i in range(count):
+        await tokens.verify(issued[i % users])
+    elapsed = time.perf_counter() - started
+    print(
+        f"{count / elapsed:10.0f} verifications/s, "
+        f"{elapsed / count * 1e6:6.2f} us per token, "
+        f"false positives {tokens.false_positives}"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--redis-dsn", default="redis://localhost:6379")
+    parser.add_argument("-n", "--requests", type=int, default=200000)
+    parser.add_argument("-u", "--users", type=int, default=1000)
+    parser.add_argument("--revoked", type=int, default=100000)
+    parser.add_argument("--error-rate", type=float, default=0.001)
+    args = parser.parse_args()
+
+    tokens = SessionTokens(
+        Redis(args.redis_dsn, max_connections=1),
+        enabled=True,
+        secret=secrets.token_hex(32),
+        denylist_capacity=args.revoked,
+        denylist_error_rate=args.error_rate,
+    )
+    for _ in range(args.revoked):
+        tokens._add(f"t:{secrets.token_urlsafe(9)}")
+    asyncio.run(measure(tokens, args.requests, args.users))